@@ -1,7 +1,11 @@
 import os
-import json
 import logging
+import tempfile
 from flask import Flask, render_template, request, redirect, url_for
+from jinja2 import FileSystemBytecodeCache
+from catalog import ProjectCatalog
+from page_cache import PageCache
+from bundles import BundleStore
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -9,32 +13,27 @@ logging.basicConfig(level=logging.DEBUG)
 # Create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+app.config['STREAM_PROJECT_DOWNLOADS'] = os.environ.get("STREAM_PROJECT_DOWNLOADS") == "1"
 
-def load_projects():
-    """Load projects from JSON data file"""
-    try:
-        with open('data/projects.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logging.error("Projects data file not found")
-        return {"projects": [], "categories": []}
-    except json.JSONDecodeError:
-        logging.error("Invalid JSON in projects data file")
-        return {"projects": [], "categories": []}
-
-def get_unique_technologies(projects):
-    """Extract unique technologies from all projects"""
-    technologies = set()
-    for project in projects:
-        technologies.update(project.get('technologies', []))
-    return sorted(list(technologies))
-
-def get_unique_categories(projects):
-    """Extract unique categories from all projects"""
-    categories = set()
-    for project in projects:
-        categories.add(project.get('category', 'Other'))
-    return sorted(list(categories))
+# Share compiled templates between workers so cold workers skip compilation
+jinja_cache_dir = os.environ.get("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "portfolio-jinja-cache"))
+try:
+    os.makedirs(jinja_cache_dir, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(jinja_cache_dir)}
+except OSError as e:
+    logging.warning(f"Jinja bytecode cache disabled: {str(e)}")
+
+# Projects catalog, parsed once per worker and reloaded when the file changes
+project_catalog = ProjectCatalog(os.path.join(app.root_path, 'data', 'projects.json'))
+
+# Rendered portfolio pages, keyed on route, query string and catalog version
+page_cache = PageCache(project_catalog, max_entries=int(os.environ.get("PAGE_CACHE_SIZE", 256)))
+
+# Prebuilt project download ZIPs, rebuilt only when their input files change
+bundle_store = BundleStore(
+    os.environ.get("BUNDLE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "portfolio-bundles")),
+    downloads_dir=os.path.join(app.root_path, 'static', 'downloads'))
+bundle_store.manifest(project_catalog.snapshot())
 
 # Import routes
 from routes import *
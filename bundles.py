@@ -0,0 +1,318 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import zipfile
+
+DOWNLOADS_DIR = os.path.join('static', 'downloads')
+
+# Formats that are already compressed and gain nothing from DEFLATE
+STORED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg', '.gif', '.zip', '.gz', '.xlsx', '.docx', '.pptx'}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Seconds the stats of the downloads are trusted before they are checked
+# again. Edited files are picked up within this interval rather than on the
+# very next download, in exchange for no filesystem calls on most downloads.
+STAT_INTERVAL = 2.0
+
+
+def archive_name(filename):
+    """Folder a project file is placed in inside the ZIP"""
+    if filename.endswith('.py'):
+        return f"python_scripts/{filename}"
+    elif filename.endswith('.sql'):
+        return f"sql_queries/{filename}"
+    elif filename.endswith('.csv'):
+        return f"datasets/{filename}"
+    elif filename.endswith('.R'):
+        return f"r_analysis/{filename}"
+    return filename
+
+
+def compression_for(filename):
+    """ZIP compression method for a project file"""
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class _StreamBuffer:
+    """Write-only file object that collects ZIP output until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def build_readme(files, project_name, generated):
+    """README placed at the root of every project bundle"""
+    readme_content = f"""# {project_name} - Data Analytics Portfolio
+
+## Project Overview
+This package contains professional data analytics work demonstrating expertise in:
+- Advanced data processing and analysis
+- Database design and optimization
+- Interactive visualization development
+- Statistical modeling and machine learning
+
+## Files Included
+"""
+    for bundle_file in files:
+        readme_content += f"- {bundle_file.filename}: {bundle_file.description}\n"
+
+    readme_content += f"""
+## Technical Stack
+- Python for data processing and analysis
+- SQL for database operations
+- Plotly/Dash for interactive visualizations
+- R for statistical analysis
+- PowerBI/Tableau for business intelligence
+
+## Contact Information
+Wang Mingkai
+Master of Science in Business Analytics
+Nanyang Technological University Singapore
+
+---
+Portfolio generated: {generated}
+"""
+    return readme_content
+
+
+class BundleFile:
+    """One input file of a project bundle, resolved and stat'ed once"""
+
+    def __init__(self, filename, path, description, st):
+        self.filename = filename
+        self.path = path
+        self.description = description
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+
+
+class ProjectBundle:
+    """Download package of one project, as described by its manifest entry"""
+
+    def __init__(self, project_id, project_name, files):
+        self.project_id = project_id
+        self.project_name = project_name
+        self.files = files
+        self.total_size = sum(bundle_file.size for bundle_file in files)
+        self.download_name = f"{project_name}_DataAnalytics_Portfolio.zip"
+
+        # Date the README by its newest input so unchanged bundles keep their hash
+        newest = max((bundle_file.mtime for bundle_file in files), default=0)
+        self.readme = build_readme(files, project_name,
+                                   time.strftime('%Y-%m-%d', time.localtime(newest)))
+
+        digest = hashlib.sha256(self.readme.encode('utf-8'))
+        for bundle_file in files:
+            digest.update(f"\0{bundle_file.filename}\0{bundle_file.size}\0{bundle_file.mtime_ns}".encode('utf-8'))
+        self.digest = digest.hexdigest()[:32]
+
+    def is_stale(self):
+        """True when an input file was edited, replaced or removed since it was stat'ed"""
+        for bundle_file in self.files:
+            try:
+                st = os.stat(bundle_file.path)
+            except OSError:
+                return True
+            if st.st_size != bundle_file.size or st.st_mtime_ns != bundle_file.mtime_ns:
+                return True
+        return False
+
+
+def bundle_name_for(project):
+    """Name used for a project's ZIP file and README heading"""
+    if project.get('bundle_name'):
+        return project['bundle_name']
+    return '_'.join(word.capitalize() for word in str(project['id']).split('-'))
+
+
+class DownloadManifest:
+    """Download bundles of every project, built from ``downloads`` entries.
+
+    A project offers a bundle when its ``downloads`` list links to
+    ``/download/project/<id>``; the bundle contains every other entry that
+    points at ``/downloads/<filename>``. Missing files are logged and left
+    out. Bundle files are re-stat'ed at most every ``STAT_INTERVAL`` seconds.
+    """
+
+    def __init__(self, projects, downloads_dir):
+        self.downloads_dir = downloads_dir
+        self.projects = {}
+        self.bundles = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+        for project in projects:
+            project_id = project.get('id')
+            downloads = project.get('downloads') or []
+            if f"/download/project/{project_id}" not in {d.get('url') for d in downloads}:
+                continue
+            self.projects[project_id] = project
+            self.bundles[project_id] = self._build(project)
+            self._checked[project_id] = time.monotonic()
+
+    def _build(self, project):
+        project_id = project.get('id')
+        files = []
+        for download in project.get('downloads') or []:
+            url = download.get('url', '')
+            if not url.startswith('/downloads/'):
+                continue
+            filename = os.path.basename(url)
+            file_path = os.path.join(self.downloads_dir, filename)
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                logging.warning(f"Download file {filename} for project {project_id} not found")
+                continue
+            description = download.get('description') or download.get('name') or 'Project component'
+            files.append(BundleFile(filename, file_path, description, st))
+        return ProjectBundle(project_id, bundle_name_for(project), files)
+
+    def get(self, project_id):
+        """Return the project's bundle, re-described if one of its files changed.
+
+        Editing a file in place leaves the directory mtime alone, so the
+        bundle's own files are re-stat'ed, once per ``STAT_INTERVAL``.
+        """
+        bundle = self.bundles.get(project_id)
+        now = time.monotonic()
+        if bundle is not None and now - self._checked[project_id] >= STAT_INTERVAL:
+            self._checked[project_id] = now
+            if bundle.is_stale():
+                with self._lock:
+                    bundle = self.bundles[project_id]
+                    if bundle.is_stale():
+                        bundle = self._build(self.projects[project_id])
+                        self.bundles[project_id] = bundle
+        return bundle
+
+    def total_size(self, project_id):
+        """Combined size of the bundle's input files in bytes, None without a bundle"""
+        bundle = self.get(project_id)
+        return bundle.total_size if bundle is not None else None
+
+
+class BundleStore:
+    """Content-addressed store of prebuilt project ZIP files.
+
+    Bundles are described by a ``DownloadManifest`` that is rebuilt when the
+    catalog version or the downloads directory changes; a bundle whose files
+    were edited in place is re-described on lookup. Both are checked at most
+    every ``STAT_INTERVAL`` seconds. Each ZIP is stored under
+    a hash of its README text and the name, size and mtime of every input
+    file and is only rebuilt when that hash changes.
+    """
+
+    def __init__(self, directory, downloads_dir=DOWNLOADS_DIR):
+        self.directory = directory
+        self.downloads_dir = downloads_dir
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_key = None
+        self._dir_checked = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def manifest(self, catalog_snapshot):
+        """Return the download manifest for the given catalog snapshot"""
+        now = time.monotonic()
+        if (self._manifest_key is not None and self._manifest_key[0] == catalog_snapshot.version
+                and now - self._dir_checked < STAT_INTERVAL):
+            return self._manifest
+        self._dir_checked = now
+        try:
+            downloads_mtime = os.stat(self.downloads_dir).st_mtime_ns
+        except OSError:
+            downloads_mtime = None
+        key = (catalog_snapshot.version, downloads_mtime)
+        if key != self._manifest_key:
+            with self._lock:
+                if key != self._manifest_key:
+                    self._manifest = DownloadManifest(catalog_snapshot.projects, self.downloads_dir)
+                    self._manifest_key = key
+        return self._manifest
+
+    def get(self, bundle):
+        """Return the path of the prebuilt bundle, building it if needed"""
+        zip_path = os.path.join(self.directory, f"{bundle.project_name}-{bundle.digest}.zip")
+        if not os.path.exists(zip_path):
+            with self._lock:
+                if not os.path.exists(zip_path):
+                    self._build(zip_path, bundle)
+                    self._prune(bundle.project_name, zip_path)
+        return zip_path
+
+    def _build(self, zip_path, bundle):
+        # Write to a temporary file and rename, so other workers never see
+        # a partially written bundle
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                    zip_file.writestr("README.md", bundle.readme)
+                    for bundle_file in bundle.files:
+                        zip_file.write(bundle_file.path, archive_name(bundle_file.filename),
+                                       compress_type=compression_for(bundle_file.filename))
+            os.replace(tmp_path, zip_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        logging.info(f"Built project bundle {os.path.basename(zip_path)}")
+
+    def stream(self, bundle):
+        """Generate the bundle as ZIP chunks without touching the disk.
+
+        Entries are read and compressed in ``STREAM_CHUNK_SIZE`` pieces and
+        each piece is yielded as soon as it is written, so memory use stays
+        bounded and the client starts receiving bytes straight away.
+        """
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("README.md", bundle.readme)
+            yield buffer.drain()
+
+            for bundle_file in bundle.files:
+                zip_info = zipfile.ZipInfo.from_file(bundle_file.path, archive_name(bundle_file.filename))
+                zip_info.compress_type = compression_for(bundle_file.filename)
+                with open(bundle_file.path, 'rb') as source, zip_file.open(zip_info, 'w') as entry:
+                    while True:
+                        chunk = source.read(STREAM_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        entry.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                yield buffer.drain()
+        # Central directory is written when the archive is closed
+        yield buffer.drain()
+
+    def _prune(self, project_name, keep_path):
+        """Remove outdated bundles of the same project"""
+        prefix = f"{project_name}-"
+        keep_name = os.path.basename(keep_path)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if (name.startswith(prefix) and name.endswith('.zip')
+                    and len(name) == len(keep_name) and path != keep_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from search import SearchIndex
+
+
+SLUG_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def slugify(value):
+    """Normalise an id or title to a lowercase, dash-separated slug"""
+    return SLUG_PATTERN.sub('-', str(value).lower()).strip('-')
+
+
+def empty_catalog_data():
+    """Return the fallback catalog used when the data file cannot be read"""
+    return {"projects": [], "categories": []}
+
+
+class CatalogSnapshot:
+    """Parsed contents of one version of the projects data file"""
+
+    def __init__(self, data, version, last_modified=None):
+        self.data = data
+        self.version = version
+        self.last_modified = last_modified
+        self.projects = data.get('projects', [])
+        self.search_index = SearchIndex(self.projects)
+
+        # Id lookups, plus slug aliases so e.g. differently cased ids resolve
+        self.projects_by_id = {}
+        self.aliases = {}
+        for project in self.projects:
+            project_id = project.get('id')
+            if project_id is None:
+                continue
+            self.projects_by_id.setdefault(project_id, project)
+            for alias in (slugify(project_id), slugify(project.get('title', ''))):
+                if alias:
+                    self.aliases.setdefault(alias, project_id)
+
+        self._aggregate()
+
+    def _aggregate(self):
+        """Compute facet lists and technology skill levels in a single pass"""
+        tech_counts = {}
+        categories = set()
+        for project in self.projects:
+            categories.add(project.get('category', 'Other'))
+            for tech in project.get('technologies', []):
+                tech_counts[tech] = tech_counts.get(tech, 0) + 1
+
+        # Filter sidebar facets
+        self.technologies = sorted(tech_counts)
+        self.categories = sorted(categories)
+        self.tech_counts = tech_counts
+
+        # Skill levels based on usage, relative to the most used technology
+        max_count = max(tech_counts.values()) if tech_counts else 1
+        skills = []
+        for tech, count in tech_counts.items():
+            skills.append({
+                'name': tech,
+                'proficiency': int(min(100, (count / max_count) * 100)),
+                'projects_count': count
+            })
+        skills.sort(key=lambda x: x['proficiency'], reverse=True)
+        self.skills = skills
+
+    def get_project(self, project_id):
+        """Return the project with the given id or slug alias, or None"""
+        project = self.projects_by_id.get(project_id)
+        if project is None:
+            canonical_id = self.aliases.get(slugify(project_id))
+            if canonical_id is not None:
+                project = self.projects_by_id[canonical_id]
+        return project
+
+    @property
+    def etag(self):
+        """Strong validator for anything derived from this catalog version"""
+        return f'"{self.version}"'
+
+
+class ProjectCatalog:
+    """Per-process cache of the projects data file.
+
+    The file is parsed once and kept in memory. Every access does a cheap
+    ``os.stat`` and the file is only re-read when its inode, mtime or size
+    changes, so edits still show up without restarting the workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat_key = object()  # Sentinel so the first access always loads
+        self._snapshot = CatalogSnapshot(empty_catalog_data(), 'empty')
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def snapshot(self):
+        """Return the current snapshot, reloading the file if it changed"""
+        stat_key = self._stat()
+        if stat_key != self._stat_key:
+            with self._lock:
+                if stat_key != self._stat_key:
+                    self._reload(stat_key)
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    @property
+    def etag(self):
+        return self.snapshot().etag
+
+    def _reload(self, stat_key):
+        self._stat_key = stat_key
+
+        if stat_key is None:
+            logging.error("Projects data file not found")
+            self._snapshot = CatalogSnapshot(empty_catalog_data(), 'empty')
+            return
+
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw)
+        except OSError:
+            logging.error("Projects data file could not be read")
+            return
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # Keep serving the last good version, e.g. while an editor is
+            # halfway through saving the file
+            logging.error("Invalid JSON in projects data file")
+            return
+
+        version = hashlib.sha256(raw).hexdigest()[:20]
+        self._snapshot = CatalogSnapshot(data, version, last_modified=stat_key[2] / 1e9)
+        logging.info(f"Loaded projects catalog version {version}")
@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, make_response, render_template
+
+try:
+    import brotli
+except ImportError:  # Optional, pages are still served gzipped without it
+    brotli = None
+
+
+class CachedPage:
+    """Rendered body and headers of one cached page"""
+
+    def __init__(self, body, status, mimetype):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+
+
+class PageCache:
+    """Size-bounded LRU cache of rendered pages.
+
+    Pages are keyed on the endpoint, its view arguments, the normalised query
+    string and the catalog version, so a catalog edit invalidates everything
+    at once. Responses carry a strong ETag and the catalog's Last-Modified
+    date, and conditional requests are answered with 304 before the view or
+    the template engine is touched.
+    """
+
+    def __init__(self, catalog, max_entries=256):
+        self.catalog = catalog
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _normalise_args(args):
+        # Sort by name only so repeated parameters keep their order
+        items = [(name, value.lower() if name == 'search' else value)
+                 for name, value in args.items(multi=True) if value]
+        return tuple(sorted(items, key=lambda item: item[0]))
+
+    def cached(self, view):
+        """Decorator serving a view from the cache with conditional GET support"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_app.debug:
+                return view(*args, **kwargs)
+
+            snapshot = self.catalog.snapshot()
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   self._normalise_args(request.args), snapshot.version)
+
+            entry = self._get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = CachedPage(response.get_data(), response.status_code, response.mimetype)
+                self._set(key, entry)
+
+            response = current_app.response_class(entry.body, status=entry.status,
+                                                  mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            if snapshot.last_modified is not None:
+                response.last_modified = snapshot.last_modified
+            response.cache_control.public = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+
+
+class PrerenderedPage:
+    """Template without per-request context, rendered once per worker.
+
+    The rendered HTML is kept as bytes together with gzip and (when the
+    ``brotli`` package is installed) brotli variants, and the best variant the
+    client accepts is served with a per-encoding strong ETag.
+    """
+
+    def __init__(self, template_name, **context):
+        self.template_name = template_name
+        self.context = context
+        self._variants = None
+        self._etag = None
+        self._lock = threading.Lock()
+
+    def _render(self):
+        body = render_template(self.template_name, **self.context).encode('utf-8')
+        variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(body)
+        self._etag = hashlib.sha256(body).hexdigest()[:32]
+        self._variants = variants
+
+    def response(self):
+        """Return the pre-rendered page, negotiating the content encoding"""
+        if self._variants is None or current_app.debug:
+            with self._lock:
+                if self._variants is None or current_app.debug:
+                    self._render()
+
+        encodings = [encoding for encoding in ('br', 'gzip') if encoding in self._variants]
+        encoding = request.accept_encodings.best_match(encodings) or 'identity'
+
+        response = current_app.response_class(self._variants[encoding], mimetype='text/html')
+        if encoding != 'identity':
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(f"{self._etag}-{encoding}")
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -0,0 +1,211 @@
+import os
+import csv
+import io
+import json
+import threading
+from collections import OrderedDict
+from markupsafe import Markup, escape
+
+try:
+    from pygments import highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+except ImportError:  # Optional, Prism highlights in the browser without it
+    highlight = None
+
+# Prism/Pygments language for each previewable extension
+LANGUAGES = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.sql': 'sql',
+    '.html': 'html',
+    '.css': 'css',
+    '.json': 'json',
+    '.r': 'r',
+}
+
+# Extensions with a preview, anything else (PDFs, images, archives) is refused
+# rather than decoded as text
+PREVIEW_EXTENSIONS = set(LANGUAGES) | {'.ipynb', '.csv', '.txt', '.md'}
+
+LINES_PER_PAGE = 300
+CSV_ROWS_PER_PAGE = 100
+NOTEBOOK_CELLS_PER_PAGE = 15
+NOTEBOOK_OUTPUT_LIMIT = 4000
+
+PYGMENTS_STYLE = 'monokai'
+
+
+def language_for(filename):
+    """Language used to highlight a file, 'text' when unknown"""
+    return LANGUAGES.get(os.path.splitext(filename)[1].lower(), 'text')
+
+
+def can_preview(filename):
+    """True for the text formats the preview renders"""
+    return os.path.splitext(filename)[1].lower() in PREVIEW_EXTENSIONS
+
+
+class UnsupportedPreview(ValueError):
+    """Raised for files that are not in a previewable text format"""
+
+
+def highlight_css():
+    """Stylesheet for server-side highlighted code, empty without Pygments"""
+    if highlight is None:
+        return ''
+    return HtmlFormatter(style=PYGMENTS_STYLE).get_style_defs('.highlight')
+
+
+def highlight_code(code, language):
+    """Highlight code on the server, falling back to markup for Prism"""
+    if highlight is not None:
+        try:
+            lexer = get_lexer_by_name(language)
+        except ClassNotFound:
+            lexer = None
+        if lexer is not None:
+            return Markup(highlight(code, lexer, HtmlFormatter(style=PYGMENTS_STYLE)))
+    return Markup(f'<pre class="language-{language} mb-0"><code>{escape(code)}</code></pre>')
+
+
+class Preview:
+    """One rendered page of a file preview"""
+
+    def __init__(self, html, page, pages, kind, language):
+        self.html = html
+        self.page = page
+        self.pages = pages
+        self.kind = kind
+        self.language = language
+
+
+def _page_count(total, per_page):
+    return max(1, (total + per_page - 1) // per_page)
+
+
+class PreviewRenderer:
+    """Renders and caches paginated previews of files in the downloads folder.
+
+    Rendered pages are cached by file path, mtime, size and page number, so a
+    preview is only highlighted again after the file changes. Plain text
+    files are split into pages through a per-version index of line offsets,
+    which lets a page be read with a single seek; notebooks and CSV files get
+    their own renderers instead of a raw text dump.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._line_offsets = {}
+        self._lock = threading.Lock()
+
+    def render(self, file_path, filename, page=1):
+        """Return the Preview for one page of a file"""
+        if not can_preview(filename):
+            raise UnsupportedPreview(f"Preview is not available for {os.path.splitext(filename)[1] or 'this'} files")
+        st = os.stat(file_path)
+        version = (file_path, st.st_mtime_ns, st.st_size)
+        key = version + (page,)
+
+        with self._lock:
+            preview = self._pages.get(key)
+            if preview is not None:
+                self._pages.move_to_end(key)
+                return preview
+
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == '.ipynb':
+            preview = self._render_notebook(file_path, page)
+        elif extension == '.csv':
+            preview = self._render_csv(file_path, page)
+        else:
+            preview = self._render_text(file_path, version, language_for(filename), page)
+
+        with self._lock:
+            self._pages[key] = preview
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return preview
+
+    def _offsets(self, file_path, version):
+        """Byte offset of the first line of every page"""
+        offsets = self._line_offsets.get(version)
+        if offsets is None:
+            offsets = [0]
+            position = 0
+            line_count = 0
+            with open(file_path, 'rb') as f:
+                for line in f:
+                    position += len(line)
+                    line_count += 1
+                    if line_count % LINES_PER_PAGE == 0:
+                        offsets.append(position)
+            if len(offsets) > 1 and offsets[-1] == position:
+                offsets.pop()
+            with self._lock:
+                # Only the current version of each file is worth keeping
+                for stale in [v for v in self._line_offsets if v[0] == file_path]:
+                    del self._line_offsets[stale]
+                self._line_offsets[version] = offsets
+        return offsets
+
+    def _render_text(self, file_path, version, language, page):
+        offsets = self._offsets(file_path, version)
+        page = min(max(page, 1), len(offsets))
+        with open(file_path, 'rb') as f:
+            f.seek(offsets[page - 1])
+            if page < len(offsets):
+                data = f.read(offsets[page] - offsets[page - 1])
+            else:
+                data = f.read()
+        html = highlight_code(data.decode('utf-8', errors='replace'), language)
+        return Preview(html, page, len(offsets), 'code', language)
+
+    def _render_csv(self, file_path, page):
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        header, rows = (rows[0], rows[1:]) if rows else ([], [])
+        pages = _page_count(len(rows), CSV_ROWS_PER_PAGE)
+        page = min(max(page, 1), pages)
+        window = rows[(page - 1) * CSV_ROWS_PER_PAGE:page * CSV_ROWS_PER_PAGE]
+
+        out = io.StringIO()
+        out.write('<table class="table table-dark table-sm table-striped mb-0"><thead><tr>')
+        for cell in header:
+            out.write(f'<th>{escape(cell)}</th>')
+        out.write('</tr></thead><tbody>')
+        for row in window:
+            out.write('<tr>')
+            for cell in row:
+                out.write(f'<td>{escape(cell)}</td>')
+            out.write('</tr>')
+        out.write('</tbody></table>')
+        return Preview(Markup(out.getvalue()), page, pages, 'table', 'csv')
+
+    def _render_notebook(self, file_path, page):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            notebook = json.load(f)
+        cells = notebook.get('cells', [])
+        language = (notebook.get('metadata', {}).get('kernelspec', {}).get('language')
+                    or 'python')
+        pages = _page_count(len(cells), NOTEBOOK_CELLS_PER_PAGE)
+        page = min(max(page, 1), pages)
+        window = cells[(page - 1) * NOTEBOOK_CELLS_PER_PAGE:page * NOTEBOOK_CELLS_PER_PAGE]
+
+        parts = []
+        for cell in window:
+            source = ''.join(cell.get('source', []))
+            if cell.get('cell_type') == 'code':
+                parts.append(Markup('<div class="notebook-cell notebook-code">'))
+                parts.append(highlight_code(source, language))
+                for output in cell.get('outputs', []):
+                    text = output.get('text') or output.get('data', {}).get('text/plain') or []
+                    text = ''.join(text)[:NOTEBOOK_OUTPUT_LIMIT]
+                    if text:
+                        parts.append(Markup('<pre class="notebook-output mb-0">{}</pre>').format(text))
+                parts.append(Markup('</div>'))
+            else:
+                parts.append(Markup('<pre class="notebook-cell notebook-markdown mb-0">{}</pre>').format(source))
+        return Preview(Markup('').join(parts), page, pages, 'notebook', language)
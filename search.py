@@ -0,0 +1,103 @@
+import re
+import difflib
+from bisect import bisect_left
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+# Fields that feed free-text search, in addition to technologies
+TEXT_FIELDS = ('title', 'description', 'readme')
+LIST_FIELDS = ('features', 'technologies')
+
+FUZZY_CUTOFF = 0.8
+FUZZY_MATCHES = 3
+MATCH_CACHE_SIZE = 1024
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens"""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex:
+    """Inverted index over the projects of one catalog version.
+
+    Projects are referred to by their position in the catalog so results can
+    be returned in the original order. Free-text queries match token prefixes
+    and fall back to fuzzy matching for tokens with no prefix hits, while
+    technology and category filters are plain dictionary lookups.
+    """
+
+    def __init__(self, projects):
+        self.projects = projects
+        self._all = frozenset(range(len(projects)))
+        self._postings = {}
+        self._by_tech = {}
+        self._by_category = {}
+        self._match_cache = {}
+
+        for position, project in enumerate(projects):
+            tokens = set()
+            for field in TEXT_FIELDS:
+                tokens.update(tokenize(project.get(field)))
+            for field in LIST_FIELDS:
+                for value in project.get(field) or []:
+                    tokens.update(tokenize(value))
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(position)
+
+            for tech in project.get('technologies', []):
+                self._by_tech.setdefault(tech, set()).add(position)
+            self._by_category.setdefault(project.get('category', ''), set()).add(position)
+
+        self._vocabulary = sorted(self._postings)
+
+    def _prefix_tokens(self, token):
+        start = bisect_left(self._vocabulary, token)
+        matches = []
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(token):
+                break
+            matches.append(candidate)
+        return matches
+
+    def _match_token(self, token):
+        """Return the set of project positions matching one query token"""
+        cached = self._match_cache.get(token)
+        if cached is not None:
+            return cached
+
+        candidates = self._prefix_tokens(token)
+        if not candidates:
+            candidates = difflib.get_close_matches(
+                token, self._vocabulary, n=FUZZY_MATCHES, cutoff=FUZZY_CUTOFF)
+
+        positions = set()
+        for candidate in candidates:
+            positions |= self._postings[candidate]
+        positions = frozenset(positions)
+
+        if len(self._match_cache) >= MATCH_CACHE_SIZE:
+            self._match_cache.clear()
+        self._match_cache[token] = positions
+        return positions
+
+    def search(self, query='', tech='', category=''):
+        """Return the projects matching all of the given filters"""
+        positions = self._all
+
+        if tech:
+            positions = positions & self._by_tech.get(tech, frozenset())
+
+        if category:
+            positions = positions & self._by_category.get(category, frozenset())
+
+        for token in tokenize(query):
+            if not positions:
+                break
+            positions = positions & self._match_token(token)
+
+        if positions is self._all:
+            return list(self.projects)
+        return [self.projects[position] for position in sorted(positions)]
@@ -5,71 +5,370 @@ Created on Wed Feb  5 17:28:47 2025
 
 @author: mingkaiwang
 """
-from flask import Blueprint, render_template, request, jsonify, current_app
-from flask_login import login_required
+from flask import Blueprint, render_template, request, jsonify, current_app, session
+from flask_login import login_required, current_user
+import asyncio
 import json
+import math
 import os
-import signal
-import psutil
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime
 import google.generativeai as genai
 from dotenv import load_dotenv
+from engagement import (gemini_breaker, gemini_async_pool, GeminiAPIError, retry_headers, sse_event,
+                        wants_stream, stream_response)
 
 # Load environment variables
 load_dotenv()
 
 support_bp = Blueprint('support_bp', __name__)
 
-# Configure Google Gemini
+# Google Gemini, configured when the blueprint is registered
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    print("Error: GEMINI_API_KEY environment variable not set")
-else:
-    genai.configure(api_key=GEMINI_API_KEY)
-    # Create Gemini model instance
-    model = genai.GenerativeModel('gemini-pro')
-
-# Configure file path
-HISTORY_FILE = "question_history.json"
-
-def load_history():
-    """Load history from file"""
-    try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    except Exception as e:
-        print(f"Failed to load history: {str(e)}")
-        return []
+model = None
 
-def save_history(history):
-    """Save history to file"""
-    try:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"Failed to save history: {str(e)}")
-        return False
+# Configure file paths
+HISTORY_FILE = "question_history.json"  # Legacy JSON history, migrated on first start
+HISTORY_DB = os.getenv('SUPPORT_HISTORY_DB', "question_history.sqlite3")
+HISTORY_RETENTION_DAYS = int(os.getenv('SUPPORT_HISTORY_RETENTION_DAYS', 90))
+HISTORY_MAX_ENTRIES = int(os.getenv('SUPPORT_HISTORY_MAX_ENTRIES', 100000))
+HISTORY_PAGE_SIZE = 50       # Default entries per get_history page
+HISTORY_MAX_PAGE_SIZE = 500   # Largest page a client can ask for
+CHAT_HISTORY_LIMIT = 10       # Recent questions returned with each chat reply
+CHAT_SESSION_MAX = int(os.getenv('SUPPORT_CHAT_SESSIONS', 500))  # Conversations kept per worker
+CHAT_SESSION_IDLE_SECONDS = 1800  # Idle time before a conversation is dropped
+CHAT_TOKEN_BUDGET = 2000          # Approximate tokens of past turns resent with each message
+FAQ_SIMILARITY = float(os.getenv('SUPPORT_FAQ_SIMILARITY', 0.75))  # Cosine similarity needed to reuse an answer
+FAQ_MAX_ENTRIES = int(os.getenv('SUPPORT_FAQ_MAX_ENTRIES', 5000))   # Answered questions kept in the index
+FAQ_REFRESH_SECONDS = 30  # How often answers recorded by other workers are picked up
 
-def release_port(port=5102):
-    """Release specified port to prevent 'Address Already in Use' error"""
-    try:
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+class HistoryStore:
+    """Append-only question history in a SQLite file shared by all workers.
+
+    Each question is a single INSERT, so writes cost the same however long
+    the history gets, and WAL mode lets workers read while another one
+    writes. Reads are paginated newest first through the rowid, with an
+    index on the timestamp for date filters. Entries past the retention
+    period or beyond ``max_entries`` are removed by periodic compaction.
+    """
+
+    COMPACT_EVERY = 500  # Appends between compactions
+
+    def __init__(self, path, retention_days=None, max_entries=None):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._appends = 0
+        self.ready = False
+
+    def open(self):
+        """Create the schema, import any legacy JSON history and compact"""
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS question_history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT NOT NULL, created_at REAL NOT NULL, "
+                "answer TEXT)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(question_history)")}
+            if 'answer' not in columns:
+                conn.execute("ALTER TABLE question_history ADD COLUMN answer TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_question_history_created ON question_history (created_at)")
+        self.migrate_json(HISTORY_FILE)
+        self.compact()
+        self.ready = True
+
+    def ping(self):
+        """Check the database can be read"""
+        self._connect().execute("SELECT 1 FROM question_history LIMIT 1").fetchall()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _entry(row):
+        return {
+            "id": row[0],
+            "question": row[1],
+            "timestamp": datetime.fromtimestamp(row[2]).strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def append(self, question, answer=None, created_at=None):
+        """Record a question with its answer and return its entry"""
+        created_at = created_at or time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO question_history (question, answer, created_at) VALUES (?, ?, ?)",
+                (question, answer, created_at)
+            )
+        self._appends += 1
+        if self._appends % self.COMPACT_EVERY == 0:
+            self.compact()
+        return self._entry((cursor.lastrowid, question, created_at))
+
+    def page(self, limit=HISTORY_PAGE_SIZE, before=None, since=None):
+        """Up to limit entries older than the id before, oldest first"""
+        query = "SELECT id, question, created_at FROM question_history WHERE 1 = 1"
+        params = []
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        if since is not None:
+            query += " AND created_at >= ?"
+            params.append(since)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        rows = self._connect().execute(query, params).fetchall()
+        return [self._entry(row) for row in reversed(rows)]
+
+    def recent(self, limit=CHAT_HISTORY_LIMIT):
+        return self.page(limit)
+
+    def answered(self, after_id=0, limit=FAQ_MAX_ENTRIES):
+        """Newest (id, question, answer) rows after after_id, oldest first"""
+        rows = self._connect().execute(
+            "SELECT id, question, answer FROM question_history "
+            "WHERE id > ? AND answer IS NOT NULL ORDER BY id DESC LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+        return rows[::-1]
+
+    def compact(self):
+        """Apply retention limits and fold the WAL back into the database"""
+        with self._connect() as conn:
+            if self.retention_days:
+                conn.execute("DELETE FROM question_history WHERE created_at < ?",
+                             (time.time() - self.retention_days * 86400,))
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM question_history WHERE id <= ("
+                    "SELECT id FROM question_history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def migrate_json(self, json_path):
+        """Import a legacy JSON history once, then rename the file"""
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except Exception as e:
+            print(f"Failed to load history: {str(e)}")
+            return 0
+
+        rows = []
+        for item in history:
             try:
-                if proc.info['cmdline'] and any("flask" in cmd for cmd in proc.info['cmdline']):
-                    os.kill(proc.info['pid'], signal.SIGKILL)
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-    except Exception as e:
-        print(f"Failed to release port: {str(e)}")
+                created_at = datetime.strptime(item["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+            except (KeyError, TypeError, ValueError):
+                created_at = time.time()
+            if item.get("question"):
+                rows.append((item["question"], created_at))
 
-# Release port before starting
-release_port(5102)
+        conn = self._connect()
+        with conn:
+            # Serialise with other workers migrating at the same time
+            conn.execute("BEGIN IMMEDIATE")
+            if not os.path.exists(json_path):
+                return 0
+            conn.executemany("INSERT INTO question_history (question, created_at) VALUES (?, ?)", rows)
+            os.replace(json_path, json_path + ".migrated")
+        return len(rows)
 
-# Load history
-question_history = load_history()
+history_store = HistoryStore(HISTORY_DB, retention_days=HISTORY_RETENTION_DAYS,
+                             max_entries=HISTORY_MAX_ENTRIES)
+
+# Answers to the common support topics of the demo page, always in the FAQ index
+FAQ_SEED = [
+    ("How do I reset my account password?",
+     "Password Reset Instructions:\n"
+     "1. Go to the login page and click \"Forgot Password\"\n"
+     "2. Enter your registered email address\n"
+     "3. Check your email for a reset link (may take 5-10 minutes)\n"
+     "4. Click the link and create a new secure password\n"
+     "5. Use the new password to log in\n\n"
+     "If you don't receive the email, check your spam folder or contact support."),
+    ("I need help understanding my investment portfolio performance.",
+     "Portfolio Performance Analysis:\n"
+     "- Real-time portfolio value and daily changes\n"
+     "- Asset allocation breakdown with visual charts\n"
+     "- Performance comparison to market benchmarks\n"
+     "- Risk analysis and diversification metrics\n"
+     "- Tax-loss harvesting opportunities\n\n"
+     "Would you like to schedule a call with our financial advisor team?"),
+    ("What are your fees and pricing structure?",
+     "Transparent Fee Structure:\n"
+     "- Portfolio Management: 0.75% annually\n"
+     "- Financial Planning: $199 one-time setup\n"
+     "- Investment Trades: $0 commission\n"
+     "- Account Maintenance: No monthly fees\n"
+     "- Premium AI Advisory: $29/month\n\n"
+     "All fees are clearly disclosed with no hidden charges."),
+    ("How do I contact a human advisor?",
+     "Human Advisor Contact Options:\n"
+     "- Phone: 400-888-8888, 9 AM to 6 PM on weekdays\n"
+     "- Email: support@example.com\n"
+     "- In person: our office in the Central Business District\n\n"
+     "For specific prices or special services, our human advisors will be happy to help."),
+]
+
+STOPWORDS = frozenset("""
+a an and are as at be can could do does for from have how i if in is it me my of on or our
+please should so that the this to was we what when where which who why will with would you your
+""".split())
+
+def faq_tokens(text):
+    """Normalised terms of a question for the FAQ index"""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]  # Plural and singular should match
+        tokens.append(word)
+    return tokens
+
+class FAQIndex:
+    """TF-IDF index of answered questions for serving repeat questions locally.
+
+    Questions are stored as term counts with an inverted index from term to
+    questions, and document frequencies are kept up to date as entries are
+    added or evicted, so the index grows incrementally without a rebuild.
+    A lookup only scores questions sharing the query's rarest terms and
+    returns the best answer whose cosine similarity reaches the
+    threshold. Seeded entries are never evicted.
+    """
+
+    MAX_CANDIDATES = 200  # Questions scored per lookup
+
+    def __init__(self, threshold, max_entries):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.last_history_id = 0
+        self.last_refresh = 0.0
+        self._entries = OrderedDict()  # key -> (question, answer, term counts, pinned)
+        self._postings = {}            # term -> set of keys
+        self._df = {}
+        self._lock = threading.Lock()
+
+    def add(self, question, answer, pinned=False):
+        """Index a question and its answer, replacing an identical question"""
+        counts = {}
+        for token in faq_tokens(question):
+            counts[token] = counts.get(token, 0) + 1
+        if not counts:
+            return
+        key = " ".join(sorted(counts))
+        with self._lock:
+            if key in self._entries:
+                pinned = pinned or self._entries[key][3]
+                self._remove(key)
+            self._entries[key] = (question, answer, counts, pinned)
+            for token in counts:
+                self._postings.setdefault(token, set()).add(key)
+                self._df[token] = self._df.get(token, 0) + 1
+            while len(self._entries) > self.max_entries:
+                oldest = next((k for k, entry in self._entries.items() if not entry[3]), None)
+                if oldest is None:
+                    break
+                self._remove(oldest)
+
+    def _remove(self, key):
+        _, _, counts, _ = self._entries.pop(key)
+        for token in counts:
+            self._postings[token].discard(key)
+            self._df[token] -= 1
+            if not self._df[token]:
+                del self._df[token]
+                del self._postings[token]
+
+    def _idf(self, token):
+        return math.log((len(self._entries) + 1) / (self._df.get(token, 0) + 1)) + 1
+
+    def lookup(self, question):
+        """Return (answer, matched question, score) of the best match or None"""
+        query = {}
+        for token in faq_tokens(question):
+            query[token] = query.get(token, 0) + 1
+
+        best = None
+        with self._lock:
+            # Collect candidates from the rarest terms first, the best matches share them
+            known = sorted((token for token in query if token in self._df), key=self._df.get)
+            candidates = set()
+            for token in known:
+                if len(candidates) >= self.MAX_CANDIDATES:
+                    break
+                candidates |= self._postings[token]
+
+            if candidates:
+                idf = {token: self._idf(token) for token in query}
+                query_norm = math.sqrt(sum((count * idf[token]) ** 2 for token, count in query.items()))
+                for key in candidates:
+                    entry_question, answer, counts, _ = self._entries[key]
+                    dot = sum(count * counts[token] * idf[token] ** 2
+                              for token, count in query.items() if token in counts)
+                    norm = math.sqrt(sum((count * self._idf(token)) ** 2 for token, count in counts.items()))
+                    score = dot / (query_norm * norm)
+                    if best is None or score > best[2]:
+                        best = (answer, entry_question, score)
+
+            if best is None or best[2] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best
+
+    def refresh(self, store, force=False):
+        """Index answers recorded in the history store since the last refresh"""
+        now = time.time()
+        if not force and now - self.last_refresh < FAQ_REFRESH_SECONDS:
+            return
+        self.last_refresh = now
+        for history_id, question, answer in store.answered(self.last_history_id, self.max_entries):
+            self.add(question, answer)
+            self.last_history_id = history_id
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+faq_index = FAQIndex(FAQ_SIMILARITY, FAQ_MAX_ENTRIES)
+
+@support_bp.record_once
+def init_support(state):
+    """Configure Gemini and open the history store when the blueprint is registered"""
+    global model
+    if not GEMINI_API_KEY:
+        print("Error: GEMINI_API_KEY environment variable not set")
+    else:
+        genai.configure(api_key=GEMINI_API_KEY)
+        # Create Gemini model instance
+        model = genai.GenerativeModel('gemini-pro')
+    history_store.open()
+    for question, answer in FAQ_SEED:
+        faq_index.add(question, answer, pinned=True)
+    faq_index.refresh(history_store, force=True)
 
 # System prompt
 SYSTEM_PROMPT = """You are a professional customer service assistant responsible for answering questions about company services. Please note:
@@ -88,28 +387,222 @@ Company Information:
 - Payment Methods: Bank Transfer, PayPal, and Credit Cards
 """
 
+SYSTEM_ACKNOWLEDGEMENT = "Understood. I will follow these guidelines when answering customer questions."
+
+def estimate_tokens(content):
+    """Rough token count of a chat history entry, about four characters per token"""
+    parts = content.get('parts', []) if isinstance(content, dict) else content.parts
+    text = "".join(part if isinstance(part, str) else getattr(part, 'text', '') for part in parts)
+    return len(text) // 4 + 1
+
+class ChatSessionEntry:
+    """One user's chat object and the lock serialising their turns"""
+
+    def __init__(self, chat):
+        self.chat = chat
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+
+    def is_fresh(self):
+        """True until the conversation has a turn beyond the pinned system prompt"""
+        return len(self.chat.history) <= 2
+
+    async def acquire_async(self):
+        """Take the lock from an event loop without blocking the loop while waiting"""
+        while not self.lock.acquire(blocking=False):
+            await asyncio.sleep(0.05)
+
+class ChatSessionManager:
+    """Per-user Gemini chat sessions with bounded memory.
+
+    Each conversation starts with the system prompt pinned as its first
+    exchange, so instructions are not repeated in every message. After each
+    turn the oldest exchanges are dropped until the rest fits the token
+    budget. Sessions are evicted least recently used first, and after
+    ``idle_seconds`` without a message.
+    """
+
+    def __init__(self, max_sessions, idle_seconds, token_budget):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.token_budget = token_budget
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the session for key, starting a new conversation if needed"""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None and now - entry.last_used > self.idle_seconds:
+                entry = None
+            if entry is None:
+                entry = ChatSessionEntry(model.start_chat(history=[
+                    {"role": "user", "parts": [SYSTEM_PROMPT]},
+                    {"role": "model", "parts": [SYSTEM_ACKNOWLEDGEMENT]}
+                ]))
+                self._sessions[key] = entry
+            entry.last_used = now
+            self._sessions.move_to_end(key)
+            self._evict(now)
+        return entry
+
+    def _evict(self, now):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        while self._sessions:
+            key, entry = next(iter(self._sessions.items()))
+            if now - entry.last_used <= self.idle_seconds:
+                break
+            del self._sessions[key]
+
+    def trim(self, entry):
+        """Drop the oldest exchanges after the pinned system prompt until within budget"""
+        history = entry.chat.history
+        pinned, turns = history[:2], history[2:]
+        used = sum(estimate_tokens(content) for content in turns)
+        while turns and used > self.token_budget:
+            dropped, turns = turns[:2], turns[2:]
+            used -= sum(estimate_tokens(content) for content in dropped)
+        if len(turns) != len(history) - 2:
+            entry.chat.history = pinned + turns
+
+    def reset(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+chat_sessions = ChatSessionManager(CHAT_SESSION_MAX, CHAT_SESSION_IDLE_SECONDS, CHAT_TOKEN_BUDGET)
+
+def chat_session_key():
+    """Key of the current user's conversation"""
+    if current_user and current_user.is_authenticated:
+        return f"user:{current_user.get_id()}"
+    if 'support_chat_id' not in session:
+        session['support_chat_id'] = uuid.uuid4().hex
+    return f"session:{session['support_chat_id']}"
+
 @support_bp.route("/")
 @login_required
 def index():
     """Render chat bot interface"""
     return render_template("support.html")
 
+@support_bp.route("/health/ready")
+def readiness():
+    """Report whether this worker can serve chat requests"""
+    checks = {"model": model is not None, "history_store": history_store.ready}
+    if history_store.ready:
+        try:
+            history_store.ping()
+        except sqlite3.Error:
+            checks["history_store"] = False
+    ready = all(checks.values())
+    return jsonify({"success": ready, "ready": ready, "checks": checks}), 200 if ready else 503
+
 @support_bp.route("/get_history")
 @login_required
 def get_history():
-    """Get chat history"""
+    """Get one page of chat history, newest page first"""
     try:
-        history = load_history()
-        return jsonify({"success": True, "history": history})
+        limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+        before = request.args.get('before', type=int)
+        since = request.args.get('since')
+        if since:
+            since = datetime.fromisoformat(since).timestamp()
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "Invalid since date, ISO format required"
+        }), 400
+
+    try:
+        history = history_store.page(limit, before=before, since=since)
+        return jsonify({
+            "success": True,
+            "history": history,
+            # Pass as before to fetch the next older page
+            "next_before": history[0]["id"] if len(history) == limit else None
+        })
     except Exception as e:
         return jsonify({
             "success": False,
             "error": f"Failed to load history: {str(e)}"
         }), 500
 
+def record_question(user_message, answer=None):
+    """Append a question to the history and make a reusable answer available to the FAQ index.
+
+    Only pass an answer to a question that opened a conversation; later
+    answers depend on that user's earlier turns and must not be shared.
+    """
+    history_store.append(user_message, answer)
+    if answer:
+        faq_index.add(user_message, answer)
+
+def faq_answer(entry, user_message):
+    """Cached answer to a repeat question, or None when Gemini is needed"""
+    if not entry.is_fresh():
+        return None  # Follow-ups depend on the conversation so far
+    faq_index.refresh(history_store)
+    match = faq_index.lookup(user_message)
+    if match is None:
+        return None
+    # Keep the conversation aware of the exchange for follow-up questions.
+    # Called from the event loop, so a turn already in progress means asking Gemini.
+    if not entry.lock.acquire(blocking=False):
+        return None
+    try:
+        entry.chat.history = entry.chat.history + [
+            {"role": "user", "parts": [user_message]},
+            {"role": "model", "parts": [match[0]]}
+        ]
+        chat_sessions.trim(entry)
+    finally:
+        entry.lock.release()
+    record_question(user_message)
+    return match
+
+@support_bp.route("/faq/stats")
+@login_required
+def faq_stats():
+    """Get FAQ cache statistics"""
+    return jsonify({"success": True, "stats": faq_index.stats()})
+
+def stream_chat(entry, user_message):
+    """Server-sent events with the reply as Gemini generates it"""
+    def chunks():
+        for chunk in entry.chat.send_message(user_message, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    reply = []
+    try:
+        with entry.lock:
+            first_turn = entry.is_fresh()
+            for text in gemini_breaker.stream(chunks):
+                reply.append(text)
+                yield sse_event("chunk", {"text": text})
+            chat_sessions.trim(entry)
+    except Exception as e:
+        print(f"Gemini API Error: {str(e)}")
+        yield sse_event("error", {"error": f"AI response generation failed: {str(e)}"})
+        return
+
+    # Record question once the full reply has been sent
+    record_question(user_message, "".join(reply) if first_turn else None)
+    yield sse_event("done", {"history": history_store.recent(), "cached": False})
+
+def stream_cached(answer):
+    """Server-sent events for an answer served from the FAQ index"""
+    yield sse_event("chunk", {"text": answer})
+    yield sse_event("done", {"history": history_store.recent(), "cached": True})
+
 @support_bp.route("/chat", methods=["POST"])
 @login_required
-def chat():
+async def chat():
     """Handle user messages and provide responses using Gemini API"""
     try:
         if not request.is_json:
@@ -138,27 +631,55 @@ def chat():
                 "error": "System configuration error: API key not set"
             }), 500
 
+        entry = chat_sessions.get(chat_session_key())
+        match = faq_answer(entry, user_message)
+        if match is not None:
+            if wants_stream(data):
+                return stream_response(stream_cached(match[0]))
+            return jsonify({
+                "success": True,
+                "response": match[0],
+                "history": history_store.recent(),
+                "cached": True
+            })
+
+        if wants_stream(data):
+            return stream_response(stream_chat(entry, user_message))
+
         try:
-            # Create chat context
-            chat = model.start_chat(history=[])
-            # Send system prompt and user message
-            response = chat.send_message(f"{SYSTEM_PROMPT}\n\nUser Question: {user_message}")
+            # Continue the user's conversation, one turn at a time.
+            # Shares the circuit breaker and in-flight limit with the engagement blueprint
+            await entry.acquire_async()
+            try:
+                first_turn = entry.is_fresh()
+                if gemini_async_pool.client() is not None:
+                    # Served by FlaskASGI: the worker's loop outlives the request,
+                    # so the SDK's async client can be kept bound to it
+                    response = await gemini_breaker.call_async(entry.chat.send_message_async, user_message)
+                else:
+                    # Flask under WSGI runs this view on a throwaway loop of its own
+                    response = gemini_breaker.call(entry.chat.send_message, user_message)
+                chat_sessions.trim(entry)
+            finally:
+                entry.lock.release()
             bot_reply = response.text
 
-            # Record question
-            new_history_item = {
-                "question": user_message,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            question_history.append(new_history_item)
-            save_history(question_history)
+            # Record question, the answer is only reusable without earlier context
+            record_question(user_message, bot_reply if first_turn else None)
 
             return jsonify({
                 "success": True,
                 "response": bot_reply,
-                "history": question_history
+                "history": history_store.recent(),
+                "cached": False
             })
 
+        except GeminiAPIError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 503, retry_headers(e)
+
         except Exception as e:
             print(f"Gemini API Error: {str(e)}")
             return jsonify({
@@ -170,4 +691,11 @@ def chat():
         return jsonify({
             "success": False,
             "error": f"Request processing error: {str(e)}"
-        }), 500
\ No newline at end of file
+        }), 500
+
+@support_bp.route("/reset", methods=["POST"])
+@login_required
+def reset_chat():
+    """Start a new conversation for the current user"""
+    chat_sessions.reset(chat_session_key())
+    return jsonify({"success": True})
@@ -1,12 +1,28 @@
-from flask import Blueprint, request, jsonify, render_template, session
+from flask import Blueprint, Response, request, jsonify, render_template, session, url_for
 from flask_login import login_required
 import requests
+from requests.adapters import HTTPAdapter
+import httpx
 import os
-from functools import lru_cache, wraps
-from datetime import datetime, timedelta
+import atexit
+import asyncio
+import inspect
+import random
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from datetime import datetime
 from dotenv import load_dotenv
 import time
 import json
+import numpy as np
+import investment_engine
+import portfolio_risk
 
 load_dotenv()
 
@@ -16,10 +32,31 @@ engagement_bp = Blueprint('engagement_bp', __name__)
 class Config:
     GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
     GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-    CACHE_TIMEOUT = 300  # Cache timeout in minutes
+    GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:streamGenerateContent"
+    CACHE_TIMEOUT = 300  # Cache timeout in seconds
+    CACHE_MAX_ENTRIES = int(os.environ.get("GEMINI_CACHE_MAX_ENTRIES", 1024))
+    CACHE_BACKEND = os.environ.get("GEMINI_CACHE_BACKEND", "memory")  # memory or sqlite
+    CACHE_PATH = os.environ.get("GEMINI_CACHE_PATH", "gemini_cache.sqlite3")
     REQUEST_TIMEOUT = 30  # Request timeout in seconds
+    REQUEST_DEADLINE = 40  # Overall budget for a call including retries, in seconds
     MAX_RETRIES = 3      # Maximum retry attempts
-    RETRY_DELAY = 2      # Retry delay in seconds
+    RETRY_DELAY = 0.5    # Base delay for exponential backoff in seconds
+    RETRY_MAX_DELAY = 8  # Upper bound for a single backoff in seconds
+    RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+    # Circuit breaker and load shedding
+    BREAKER_FAILURE_RATE = 0.5   # Failure rate that opens the breaker
+    BREAKER_WINDOW = 60          # Window for the failure rate in seconds
+    BREAKER_MIN_CALLS = 10       # Calls needed in the window before it can open
+    BREAKER_OPEN_SECONDS = 30    # Time spent open before a half-open probe
+    MAX_IN_FLIGHT = int(os.environ.get("GEMINI_MAX_IN_FLIGHT", 256))  # Concurrent upstream calls per worker
+    POOL_CONNECTIONS = int(os.environ.get("GEMINI_POOL_CONNECTIONS", 4))  # Hosts kept in the pool
+    POOL_MAXSIZE = int(os.environ.get("GEMINI_POOL_MAXSIZE", 20))         # Keep-alive connections per host
+    ASYNC_POOL_MAXSIZE = int(os.environ.get("GEMINI_ASYNC_POOL_MAXSIZE", 256))  # Connections per ASGI worker
+    ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", 4))  # Background AI analysis threads
+    MAX_YEARLY_SCENARIOS = 1000  # Batch scenarios that can be returned with yearly breakdowns
+    ANALYSIS_JOB_TTL = 600       # How long finished analysis jobs can be fetched, in seconds
+    ANALYSIS_JOB_PATH = os.environ.get("ANALYSIS_JOB_PATH", "analysis_jobs.sqlite3")  # Shared by all workers
     
     # Proxy settings (if needed)
     HTTP_PROXY = os.environ.get("HTTP_PROXY")
@@ -36,93 +73,862 @@ if Config.HTTP_PROXY:
 if Config.HTTPS_PROXY:
     proxies['https'] = Config.HTTPS_PROXY
 
+# HTTP connection pool
+class GeminiHTTPPool:
+    """Keep-alive connection pool shared by all threads of a worker.
+
+    Each thread gets its own ``requests.Session`` but every session mounts
+    the same ``HTTPAdapter``, so they share one thread-safe urllib3 pool.
+    ``pool_block`` caps the connections opened per host at ``pool_maxsize``.
+    urllib3 would wait for a free connection without a time limit, so calls
+    take one through ``connection()`` first, which gives up after the
+    attempt's timeout. Proxy settings are applied once instead of being
+    re-read per request.
+    """
+
+    def __init__(self, pool_connections, pool_maxsize, proxies=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.proxies = proxies or {}
+        self._adapter = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_maxsize)  # Gemini is the only host
+
+    def open(self):
+        with self._lock:
+            if self._adapter is None:
+                self._adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=True,
+                    max_retries=0  # Retries are handled by retry_on_failure
+                )
+                self._local = threading.local()
+        return self._adapter
+
+    def session(self):
+        """Return the calling thread's session bound to the shared pool"""
+        adapter = self._adapter or self.open()
+        session = getattr(self._local, 'session', None)
+        if session is None or session.get_adapter('https://') is not adapter:
+            session = requests.Session()
+            session.trust_env = False
+            session.proxies.update(self.proxies)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+        return session
+
+    @contextmanager
+    def connection(self, timeout):
+        """Session to send one request with, once a pooled connection is free"""
+        if not self._slots.acquire(timeout=timeout):
+            raise UpstreamOverloadedError()
+        try:
+            yield self.session()
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            if self._adapter is not None:
+                self._adapter.close()
+                self._adapter = None
+
+gemini_http = GeminiHTTPPool(Config.POOL_CONNECTIONS, Config.POOL_MAXSIZE, proxies)
+
+class GeminiAsyncPool:
+    """Async HTTP clients bound to the event loop of an ASGI worker.
+
+    ``open()`` runs from the ASGI server's startup hook (see flask_asgi) and
+    creates the ``httpx.AsyncClient`` instances on the loop that serves every
+    request of the worker, so async calls share their keep-alive connections
+    without holding a thread each. Flask under a WSGI server runs each async
+    view on a loop of its own; ``client()`` returns None there.
+
+    httpcore scans its whole pool for every queued request, which costs
+    more CPU than the calls themselves with hundreds of connections, so the
+    connections are split over clients of SHARD_SIZE handed out in turn.
+    """
+    SHARD_SIZE = 16
+
+    def __init__(self, max_connections, proxies=None):
+        self.max_connections = max_connections
+        self.proxies = proxies or {}
+        self._clients = []
+        self._turn = 0
+        self._loop = None
+
+    def open(self):
+        shards = max(1, -(-self.max_connections // self.SHARD_SIZE))
+        size = -(-self.max_connections // shards)
+        limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+        self._clients = [
+            httpx.AsyncClient(
+                limits=limits,
+                timeout=Config.REQUEST_TIMEOUT,
+                mounts={f"{scheme}://": httpx.AsyncHTTPTransport(proxy=url, limits=limits)
+                        for scheme, url in self.proxies.items()} or None,
+                trust_env=False
+            )
+            for _ in range(shards)
+        ]
+        self._loop = asyncio.get_running_loop()
+
+    async def close(self):
+        clients, self._clients, self._loop = self._clients, [], None
+        for client in clients:
+            await client.aclose()
+
+    def client(self):
+        """The next client, when called on the loop they were opened on"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        if loop is not self._loop:
+            return None
+        self._turn = (self._turn + 1) % len(self._clients)
+        return self._clients[self._turn]
+
+gemini_async_pool = GeminiAsyncPool(Config.ASYNC_POOL_MAXSIZE, proxies)
+
+@engagement_bp.record_once
+def open_http_pool(state):
+    """Open the Gemini connection pool when the blueprint is registered"""
+    gemini_http.open()
+    atexit.register(gemini_http.close)
+
 # Unified response format
-def make_response(success=True, data=None, message=None, status_code=200):
+def make_response(success=True, data=None, message=None, status_code=200, headers=None):
     response = {
         "success": success,
         "timestamp": datetime.now().isoformat(),
         "data": data,
         "message": message
     }
-    return jsonify(response), status_code
+    return jsonify(response), status_code, headers or {}
+
+def retry_headers(error):
+    """Retry-After header for upstream errors that say when to come back"""
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is None:
+        return {}
+    return {"Retry-After": str(int(retry_after + 0.999))}
+
+# Response cache backends
+class MemoryCacheBackend:
+    """In-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteCacheBackend:
+    """Store shared by all workers on a host through a SQLite file"""
+
+    PURGE_EVERY = 100  # Writes between purges of expired and excess entries
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM response_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+                conn.execute(
+                    "DELETE FROM response_cache WHERE key NOT IN ("
+                    "SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM response_cache")
+
+class ResponseCache:
+    """Prompt-keyed cache of model responses with TTL and hit/miss counters"""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt):
+        # Whitespace differences should not defeat the cache
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, prompt):
+        value = self.backend.get(self.make_key(prompt))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, prompt, value):
+        self.backend.set(self.make_key(prompt), value, self.ttl)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+def create_cache_backend():
+    """Create the response cache backend selected in Config"""
+    if Config.CACHE_BACKEND == "sqlite":
+        return SQLiteCacheBackend(Config.CACHE_PATH, max_entries=Config.CACHE_MAX_ENTRIES)
+    return MemoryCacheBackend(max_entries=Config.CACHE_MAX_ENTRIES)
+
+response_cache = ResponseCache(create_cache_backend(), ttl=Config.CACHE_TIMEOUT)
+
+# Retry policy
+class GeminiAPIError(ConnectionError):
+    """Upstream failure, tagged with whether it is worth retrying"""
+
+    def __init__(self, message, status_code=None, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by an overall deadline.
+
+    Only errors marked retryable (timeouts, connection failures and the
+    statuses in ``Config.RETRYABLE_STATUSES``) are retried; validation errors
+    and other 4xx responses fail at once. A retry is skipped when its delay
+    would run past the deadline, and each attempt is given a timeout no
+    larger than the budget that is left.
+    """
+
+    def __init__(self, max_attempts, base_delay, max_delay, deadline, attempt_timeout):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+
+    @staticmethod
+    def is_retryable(error):
+        return isinstance(error, GeminiAPIError) and error.retryable
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _next_delay(self, attempt, error, deadline_at):
+        """Delay before the next attempt, or None to give up"""
+        if attempt + 1 >= self.max_attempts or not self.is_retryable(error):
+            return None
+        delay = error.retry_after if error.retry_after is not None else self.backoff(attempt)
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        return delay
+
+    def _timeout(self, deadline_at):
+        return max(0.1, min(self.attempt_timeout, deadline_at - time.monotonic()))
+
+    def call(self, func, *args, **kwargs):
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return func(*args, timeout=self._timeout(deadline_at), **kwargs)
+            except Exception as e:
+                delay = self._next_delay(attempt, e, deadline_at)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def call_async(self, func, *args, **kwargs):
+        """Same as call() for coroutine functions, without blocking a worker while waiting"""
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, timeout=self._timeout(deadline_at), **kwargs)
+            except Exception as e:
+                delay = self._next_delay(attempt, e, deadline_at)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+retry_policy = RetryPolicy(
+    max_attempts=Config.MAX_RETRIES,
+    base_delay=Config.RETRY_DELAY,
+    max_delay=Config.RETRY_MAX_DELAY,
+    deadline=Config.REQUEST_DEADLINE,
+    attempt_timeout=Config.REQUEST_TIMEOUT
+)
+
+# Circuit breaker
+class CircuitOpenError(GeminiAPIError):
+    """Raised without calling upstream while the breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__("AI service is temporarily unavailable, please try again later",
+                         status_code=503, retryable=False, retry_after=retry_after)
+
+class UpstreamOverloadedError(GeminiAPIError):
+    """Raised when too many upstream calls are already in flight"""
+
+    def __init__(self):
+        super().__init__("AI service is busy, please try again shortly",
+                         status_code=503, retryable=False, retry_after=1)
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker with a failure-rate window and in-flight limit.
+
+    While closed, outcomes from the last ``window`` seconds are kept and the
+    breaker opens once at least ``min_calls`` were made and the failure rate
+    reaches ``failure_rate``. While open, calls fail immediately; after
+    ``open_seconds`` a single probe call is let through (half-open) and its
+    outcome closes or re-opens the breaker. Calls beyond ``max_in_flight``
+    are shed regardless of state. Client errors such as 4xx responses do not
+    count as failures.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate, window, min_calls, open_seconds, max_in_flight):
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.max_in_flight = max_in_flight
+        self.state = self.CLOSED
+        self._outcomes = deque()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._in_flight = 0
+        self._rejected = 0
+        self._shed = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def counts_as_failure(error):
+        if isinstance(error, GeminiAPIError):
+            return error.retryable
+        return not isinstance(error, ValueError)
+
+    def _prune(self, now):
+        while self._outcomes and self._outcomes[0][0] <= now - self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def _acquire(self):
+        """Reserve an in-flight slot; returns True if the call is a half-open probe"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.open_seconds - now
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(retry_after=remaining)
+                self.state = self.HALF_OPEN
+
+            probe = self.state == self.HALF_OPEN
+            if probe and self._probe_in_flight:
+                self._rejected += 1
+                raise CircuitOpenError(retry_after=1)
+
+            if self._in_flight >= self.max_in_flight:
+                self._shed += 1
+                raise UpstreamOverloadedError()
+
+            self._in_flight += 1
+            if probe:
+                self._probe_in_flight = True
+            return probe
+
+    def _release(self, probe, failed):
+        with self._lock:
+            now = time.monotonic()
+            self._in_flight -= 1
+            if probe:
+                self._probe_in_flight = False
+                if failed:
+                    self.state = self.OPEN
+                    self._opened_at = now
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            self._prune(now)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and self._failures / len(self._outcomes) >= self.failure_rate):
+                self.state = self.OPEN
+                self._opened_at = now
+
+    def call(self, func, *args, **kwargs):
+        probe = self._acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._release(probe, self.counts_as_failure(e))
+            raise
+        self._release(probe, False)
+        return result
+
+    async def call_async(self, func, *args, **kwargs):
+        probe = self._acquire()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            self._release(probe, self.counts_as_failure(e))
+            raise
+        self._release(probe, False)
+        return result
+
+    def stream(self, func, *args, **kwargs):
+        """Iterate over the generator returned by func, holding a slot until it is exhausted"""
+        probe = self._acquire()
+        failed = False
+        try:
+            yield from func(*args, **kwargs)
+        except Exception as e:
+            failed = self.counts_as_failure(e)
+            raise
+        finally:
+            self._release(probe, failed)
+
+    def protect(self, func):
+        """Decorator running each call of func through the breaker"""
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.call_async(func, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+    def snapshot(self):
+        """Current state for monitoring"""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            calls = len(self._outcomes)
+            return {
+                "state": self.state,
+                "calls_in_window": calls,
+                "failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "rejected": self._rejected,
+                "shed": self._shed,
+                "open_for": round(max(0.0, self._opened_at + self.open_seconds - now), 1)
+                            if self.state == self.OPEN else 0.0
+            }
+
+# Shared by every Gemini caller in this worker, including the support blueprint
+gemini_breaker = CircuitBreaker(
+    failure_rate=Config.BREAKER_FAILURE_RATE,
+    window=Config.BREAKER_WINDOW,
+    min_calls=Config.BREAKER_MIN_CALLS,
+    open_seconds=Config.BREAKER_OPEN_SECONDS,
+    max_in_flight=Config.MAX_IN_FLIGHT
+)
 
 # Add retry decorator
-def retry_on_failure(max_retries=3, delay=1):
+def retry_on_failure(policy):
+    """Retry a function under the given policy; it must accept a timeout argument"""
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await policy.call_async(func, *args, **kwargs)
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            retries = 0
-            while retries < max_retries:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    retries += 1
-                    if retries == max_retries:
-                        raise e
-                    time.sleep(delay)
-            return None
+            return policy.call(func, *args, **kwargs)
         return wrapper
     return decorator
 
-@retry_on_failure(max_retries=Config.MAX_RETRIES, delay=Config.RETRY_DELAY)
-def get_gemini_response(prompt):
-    """Get response from Google Gemini API"""
+def parse_retry_after(value):
+    """Seconds from a Retry-After header, ignoring HTTP-date values"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def gemini_request(prompt, stream=False):
+    """URL, JSON payload and headers for a generateContent call"""
     if not Config.GEMINI_API_KEY:
         raise ValueError("System configuration error: Missing API key, please contact administrator")
-        
-    try:
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": prompt
-                }]
+
+    payload = {
+        "contents": [{
+            "parts": [{
+                "text": prompt
             }]
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
+        }]
+    }
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+    if stream:
+        headers["Accept"] = "text/event-stream"
+        url = f"{Config.GEMINI_STREAM_URL}?alt=sse&key={Config.GEMINI_API_KEY}"
+    else:
         url = f"{Config.GEMINI_API_URL}?key={Config.GEMINI_API_KEY}"
-        
-        # Send request
-        response = requests.post(
-            url, 
-            json=payload, 
-            headers=headers, 
-            timeout=Config.REQUEST_TIMEOUT,
-            proxies=proxies if proxies else None,
-            verify=True  # SSL verification
+    return url, payload, headers
+
+def parse_gemini_response(response):
+    """Validate a requests or httpx response and return the generated text"""
+    # Check response status code
+    if response.status_code >= 400:
+        raise GeminiAPIError(
+            f"API request failed with status {response.status_code}",
+            status_code=response.status_code,
+            retryable=response.status_code in Config.RETRYABLE_STATUSES,
+            retry_after=parse_retry_after(response.headers.get('Retry-After'))
         )
+    
+    # Check response Content-Type
+    content_type = response.headers.get('Content-Type', '')
+    if 'application/json' not in content_type:
+        raise ValueError(f"API returned non-JSON response: {content_type}")
+    
+    # Try to parse JSON
+    result = response.json()
+    
+    # Validate response structure
+    if not isinstance(result, dict):
+        raise ValueError("Invalid API response format")
         
-        # Check response status code
-        response.raise_for_status()
-        
-        # Check response Content-Type
-        content_type = response.headers.get('Content-Type', '')
-        if 'application/json' not in content_type:
-            raise ValueError(f"API returned non-JSON response: {content_type}")
-        
-        # Try to parse JSON
-        result = response.json()
+    if 'candidates' not in result or not result['candidates']:
+        raise ValueError("API response missing required data fields")
         
-        # Validate response structure
-        if not isinstance(result, dict):
-            raise ValueError("Invalid API response format")
-            
-        if 'candidates' not in result or not result['candidates']:
-            raise ValueError("API response missing required data fields")
-            
-        if not result['candidates'][0].get('content', {}).get('parts', []):
-            raise ValueError("API response missing text content")
+    if not result['candidates'][0].get('content', {}).get('parts', []):
+        raise ValueError("API response missing text content")
+    
+    return result['candidates'][0]['content']['parts'][0]['text']
+
+def get_gemini_response(prompt):
+    """Get response from Google Gemini API, served from cache when possible"""
+    cached = response_cache.get(prompt)
+    if cached is not None:
+        return cached
+
+    response_text = fetch_gemini_response(prompt)
+    response_cache.set(prompt, response_text)
+    return response_text
+
+@retry_on_failure(retry_policy)
+@gemini_breaker.protect
+def fetch_gemini_response(prompt, timeout=Config.REQUEST_TIMEOUT):
+    """Get response from Google Gemini API"""
+    url, payload, headers = gemini_request(prompt)
         
-        response_text = result['candidates'][0]['content']['parts'][0]['text']
-        return response_text
+    try:
+        # Send request over a pooled keep-alive connection
+        started = time.monotonic()
+        with gemini_http.connection(timeout) as http:
+            response = http.post(
+                url, 
+                json=payload, 
+                headers=headers, 
+                timeout=max(0.1, timeout - (time.monotonic() - started)),
+                verify=True  # SSL verification
+            )
+            return parse_gemini_response(response)
         
+    except (GeminiAPIError, ValueError):
+        raise
     except requests.exceptions.Timeout:
-        raise ConnectionError("API request timeout, please try again later")
+        raise GeminiAPIError("API request timeout, please try again later")
+    except requests.exceptions.ConnectionError as e:
+        raise GeminiAPIError(f"API connection failed: {str(e)}")
     except requests.exceptions.RequestException as e:
-        raise ConnectionError(f"API request failed: {str(e)}")
+        raise GeminiAPIError(f"API request failed: {str(e)}", retryable=False)
+    except Exception as e:
+        raise Exception(f"Error processing request: {str(e)}")
+
+# Background analysis jobs
+class AnalysisJobs:
+    """Runs AI analyses on a thread pool and keeps their results for polling.
+
+    Job state lives in a SQLite file shared by all workers on the host, so a
+    poll can be answered by any worker, not only the one running the job.
+    Finished jobs are kept for ``ttl`` seconds and expired ones are purged
+    as new jobs are submitted. A job still pending long after its deadline
+    (its worker was restarted) is reported as failed. A failed analysis is
+    recorded as such instead of being returned as text.
+    """
+
+    PURGE_EVERY = 100  # Submissions between purges of expired jobs
+
+    def __init__(self, path, max_workers, ttl):
+        self.path = path
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self._executor = None
+        self._futures = {}  # Jobs running in this worker, for streaming waits
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._submitted = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def open(self):
+        with self._lock:
+            if self._executor is None:
+                with self._connect() as conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS analysis_jobs ("
+                        "id TEXT PRIMARY KEY, status TEXT NOT NULL, analysis TEXT, error TEXT, "
+                        "retryable INTEGER, created REAL NOT NULL, finished REAL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_finished ON analysis_jobs (finished)")
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="analysis")
+        return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def submit(self, prompt):
+        """Start an analysis of prompt and return its job ID"""
+        executor = self._executor or self.open()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO analysis_jobs (id, status, created) VALUES (?, 'pending', ?)",
+                         (job_id, time.time()))
+            self._submitted += 1
+            if self._submitted % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM analysis_jobs WHERE finished < ?", (time.time() - self.ttl,))
+        future = executor.submit(self._run, job_id, prompt)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+        return job_id
+
+    def _run(self, job_id, prompt):
+        try:
+            result = ("completed", get_gemini_response(prompt), None, None)
+        except Exception as e:
+            result = ("failed", None, str(e), isinstance(e, GeminiAPIError) and e.retryable)
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE analysis_jobs SET status = ?, analysis = ?, error = ?, retryable = ?, finished = ? "
+                "WHERE id = ?", result + (time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        """Return the job's state as a dict, or None if it is unknown or expired"""
+        row = self._connect().execute(
+            "SELECT status, analysis, error, retryable, created, finished FROM analysis_jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None or (row[5] is not None and time.time() - row[5] > self.ttl):
+            return None
+        job = dict(zip(("status", "analysis", "error", "retryable", "created", "finished"), row))
+        job["retryable"] = bool(job["retryable"])
+        if job["status"] == "pending" and time.time() - job["created"] > 2 * Config.REQUEST_DEADLINE:
+            job.update(status="failed", error="Analysis was interrupted, please run the simulation again",
+                       retryable=True)
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job started by this worker has finished and return it"""
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return self.get(job_id)
+
+    @staticmethod
+    def describe(job_id, job):
+        result = {"job_id": job_id, "status": job["status"]}
+        if job["status"] == "completed":
+            result["ai_analysis"] = job["analysis"]
+        elif job["status"] == "failed":
+            result["error"] = job["error"]
+            result["retryable"] = job["retryable"]
+        return result
+
+analysis_jobs = AnalysisJobs(Config.ANALYSIS_JOB_PATH, Config.ANALYSIS_WORKERS, Config.ANALYSIS_JOB_TTL)
+
+@engagement_bp.record_once
+def open_analysis_jobs(state):
+    """Start the analysis thread pool when the blueprint is registered"""
+    analysis_jobs.open()
+    atexit.register(analysis_jobs.close)
+
+# Streaming
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def wants_stream(data):
+    """True when the client asked for a server-sent event stream"""
+    if isinstance(data, dict) and data.get('stream') is True:
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream'
+
+def stream_response(events):
+    """Response streaming server-sent events to the client as they are produced"""
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop proxies from buffering the stream
+    })
+
+def _stream_gemini_chunks(prompt):
+    url, payload, headers = gemini_request(prompt, stream=True)
+    try:
+        # The connection stays taken until the whole stream has been read
+        with gemini_http.connection(Config.REQUEST_TIMEOUT) as http, \
+                http.post(url, json=payload, headers=headers,
+                          timeout=Config.REQUEST_TIMEOUT, stream=True) as response:
+            if response.status_code >= 400:
+                parse_gemini_response(response)
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                result = json.loads(line[len('data:'):])
+                for candidate in result.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+    except requests.exceptions.Timeout:
+        raise GeminiAPIError("API request timeout, please try again later")
+    except requests.exceptions.ConnectionError as e:
+        raise GeminiAPIError(f"API connection failed: {str(e)}")
+
+def stream_gemini_response(prompt):
+    """Yield response text from Gemini as it is generated, caching the full text at the end"""
+    cached = response_cache.get(prompt)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = []
+    for chunk in gemini_breaker.stream(_stream_gemini_chunks, prompt):
+        chunks.append(chunk)
+        yield chunk
+    if chunks:
+        response_cache.set(prompt, "".join(chunks))
+
+# Async path
+async def get_gemini_response_async(prompt):
+    """Async version of get_gemini_response, waiting on the network without holding a thread"""
+    cached = response_cache.get(prompt)
+    if cached is not None:
+        return cached
+
+    client = gemini_async_pool.client()
+    if client is None:
+        # Flask under WSGI gave this view a loop and thread of its own, so
+        # blocking it holds up no other request
+        response_text = fetch_gemini_response(prompt)
+    else:
+        response_text = await fetch_gemini_response_async(prompt, client=client)
+    response_cache.set(prompt, response_text)
+    return response_text
+
+@retry_on_failure(retry_policy)
+@gemini_breaker.protect
+async def fetch_gemini_response_async(prompt, timeout=Config.REQUEST_TIMEOUT, client=None):
+    """Get response from Google Gemini API with the worker's httpx.AsyncClient"""
+    url, payload, headers = gemini_request(prompt)
+
+    try:
+        # The pool wait is part of the timeout, so it stays within the deadline
+        response = await client.post(url, json=payload, headers=headers, timeout=timeout)
+        return parse_gemini_response(response)
+
+    except (GeminiAPIError, ValueError):
+        raise
+    except httpx.TimeoutException:
+        raise GeminiAPIError("API request timeout, please try again later")
+    except httpx.TransportError as e:
+        raise GeminiAPIError(f"API connection failed: {str(e)}")
+    except httpx.HTTPError as e:
+        raise GeminiAPIError(f"API request failed: {str(e)}", retryable=False)
     except Exception as e:
         raise Exception(f"Error processing request: {str(e)}")
 
@@ -132,6 +938,17 @@ def index():
     """Render main page"""
     return render_template('engagement.html')
 
+@engagement_bp.route('/cache/stats', methods=['GET'])
+@login_required
+def cache_stats():
+    """Get response cache statistics"""
+    return make_response(data=response_cache.stats())
+
+@engagement_bp.route('/health/upstream', methods=['GET'])
+def upstream_health():
+    """Get Gemini circuit breaker state for monitoring"""
+    return make_response(data=gemini_breaker.snapshot())
+
 @engagement_bp.route('/profile/questions', methods=['GET'])
 @login_required
 def get_profile_questions():
@@ -151,7 +968,7 @@ def get_profile_questions():
 
 @engagement_bp.route('/profile', methods=['POST'])
 @login_required
-def analyze_profile():
+async def analyze_profile():
     """Analyze user profile"""
     try:
         data = request.get_json()
@@ -188,7 +1005,7 @@ User Information:
             prompt += f"{field}: {data.get(field, '')}\n"
         
         try:
-            analysis = get_gemini_response(prompt)
+            analysis = await get_gemini_response_async(prompt)
             if not analysis:
                 return make_response(
                     success=False,
@@ -216,7 +1033,8 @@ User Information:
             return make_response(
                 success=False,
                 message=f"Failed to generate analysis: {str(e)}",
-                status_code=503
+                status_code=503,
+                headers=retry_headers(e)
             )
         
     except Exception as e:
@@ -228,7 +1046,7 @@ User Information:
 
 @engagement_bp.route('/financial_advice', methods=['POST'])
 @login_required
-def get_financial_advice():
+async def get_financial_advice():
     """Get AI financial advice"""
     try:
         data = request.get_json()
@@ -277,8 +1095,18 @@ Please provide:
 
 Keep the advice practical, actionable, and tailored to the user's profile if available."""
 
+        if wants_stream(data):
+            def events():
+                try:
+                    for chunk in stream_gemini_response(prompt):
+                        yield sse_event("chunk", {"text": chunk})
+                    yield sse_event("done", {"question": question, "timestamp": datetime.now().isoformat()})
+                except Exception as e:
+                    yield sse_event("error", {"message": f"Failed to generate advice: {str(e)}"})
+            return stream_response(events())
+
         try:
-            advice = get_gemini_response(prompt)
+            advice = await get_gemini_response_async(prompt)
             if not advice:
                 return make_response(
                     success=False,
@@ -299,7 +1127,8 @@ Keep the advice practical, actionable, and tailored to the user's profile if ava
             return make_response(
                 success=False,
                 message=f"Failed to generate advice: {str(e)}",
-                status_code=503
+                status_code=503,
+                headers=retry_headers(e)
             )
         
     except Exception as e:
@@ -352,19 +1181,14 @@ def investment_simulation():
             )
 
         # Calculate compound interest
-        final_amount = initial_amount * (1 + annual_rate) ** years
+        try:
+            result = investment_engine.simulate(initial_amount, annual_rate, years)
+        except ValueError as e:
+            return make_response(success=False, message=str(e), status_code=400)
+        final_amount = float(result.final_amounts[0])
         total_return = final_amount - initial_amount
         roi_percentage = (total_return / initial_amount) * 100
-
-        # Generate yearly breakdown
-        yearly_breakdown = []
-        for year in range(1, years + 1):
-            amount = initial_amount * (1 + annual_rate) ** year
-            yearly_breakdown.append({
-                'year': year,
-                'amount': round(amount, 2),
-                'growth': round(amount - initial_amount, 2)
-            })
+        yearly_breakdown = result.yearly_breakdown(0)
 
         # Generate AI analysis
         analysis_prompt = f"""As a financial advisor, analyze this investment simulation:
@@ -385,26 +1209,40 @@ Please provide:
 
 Keep the analysis practical and actionable."""
 
-        try:
-            ai_analysis = get_gemini_response(analysis_prompt)
-        except Exception as e:
-            ai_analysis = f"Unable to generate detailed analysis: {str(e)}"
+        # The analysis runs in the background, numbers are returned straight away
+        job_id = analysis_jobs.submit(analysis_prompt)
+        simulation_results = {
+            "initial_amount": initial_amount,
+            "annual_rate": annual_rate * 100,
+            "years": years,
+            "final_amount": round(final_amount, 2),
+            "total_return": round(total_return, 2),
+            "roi_percentage": round(roi_percentage, 1),
+            "yearly_breakdown": yearly_breakdown
+        }
+
+        if wants_stream(data):
+            def events():
+                yield sse_event("results", {"simulation_results": simulation_results, "job_id": job_id})
+                try:
+                    job = analysis_jobs.wait(job_id, timeout=Config.REQUEST_DEADLINE)
+                except TimeoutError:
+                    job = analysis_jobs.get(job_id)  # Still pending, the client can poll
+                yield sse_event("analysis", AnalysisJobs.describe(job_id, job))
+            return stream_response(events())
 
         return make_response(
             success=True,
             data={
-                "simulation_results": {
-                    "initial_amount": initial_amount,
-                    "annual_rate": annual_rate * 100,
-                    "years": years,
-                    "final_amount": round(final_amount, 2),
-                    "total_return": round(total_return, 2),
-                    "roi_percentage": round(roi_percentage, 1),
-                    "yearly_breakdown": yearly_breakdown
+                "simulation_results": simulation_results,
+                "analysis_job": {
+                    "job_id": job_id,
+                    "status": "pending",
+                    "url": url_for('engagement_bp.get_analysis', job_id=job_id)
                 },
-                "ai_analysis": ai_analysis,
                 "timestamp": datetime.now().isoformat()
-            }
+            },
+            status_code=202
         )
         
     except Exception as e:
@@ -412,4 +1250,171 @@ Keep the analysis practical and actionable."""
             success=False,
             message=f"Error processing simulation: {str(e)}",
             status_code=500
-        )
\ No newline at end of file
+        )
+
+@engagement_bp.route('/investment_simulation/analysis/<job_id>', methods=['GET'])
+@login_required
+def get_analysis(job_id):
+    """Get the status or result of a background investment analysis"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return make_response(
+            success=False,
+            message="Analysis job not found or expired",
+            status_code=404
+        )
+    return make_response(data=AnalysisJobs.describe(job_id, job))
+
+def scenario_percentages(data, field, default=0.0):
+    """Percentage field of a request as decimals, a number or a list"""
+    value = data.get(field, default)
+    if isinstance(value, list):
+        return [float(v) / 100 for v in value]
+    return float(value) / 100
+
+@engagement_bp.route('/investment_simulation/batch', methods=['POST'])
+@login_required
+def investment_simulation_batch():
+    """Simulate many fixed-rate scenarios in one request"""
+    data = request.get_json(silent=True)
+    if not data:
+        return make_response(
+            success=False,
+            message="Request data is empty",
+            status_code=400
+        )
+
+    required_fields = ['initial_amounts', 'annual_rates', 'years']
+    missing_fields = [field for field in required_fields if field not in data]
+    if missing_fields:
+        return make_response(
+            success=False,
+            message=f"Missing required fields: {', '.join(missing_fields)}",
+            status_code=400
+        )
+
+    try:
+        result = investment_engine.simulate(
+            data['initial_amounts'],
+            scenario_percentages(data, 'annual_rates'),
+            data['years'],
+            contributions=data.get('contributions', 0.0),
+            inflation=scenario_percentages(data, 'inflation_rates'),
+            contribution_schedule=data.get('contribution_schedule'),
+            grid=bool(data.get('grid'))
+        )
+    except (ValueError, TypeError) as e:
+        return make_response(success=False, message=str(e), status_code=400)
+
+    results = {
+        "summary": result.summary(),
+        "final_amounts": np.round(result.final_amounts, 2).tolist(),
+        "real_final_amounts": np.round(result.real_final_amounts, 2).tolist()
+    }
+    if data.get('include_yearly'):
+        if len(result) > Config.MAX_YEARLY_SCENARIOS:
+            return make_response(
+                success=False,
+                message=f"Yearly breakdowns are limited to {Config.MAX_YEARLY_SCENARIOS} scenarios",
+                status_code=400
+            )
+        results["yearly_breakdown"] = [result.yearly_breakdown(i) for i in range(len(result))]
+
+    return make_response(
+        success=True,
+        data={
+            "simulation_results": results,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
+@engagement_bp.route('/investment_simulation/monte_carlo', methods=['POST'])
+@login_required
+def investment_simulation_monte_carlo():
+    """Simulate an investment over random yearly returns"""
+    data = request.get_json(silent=True)
+    if not data:
+        return make_response(
+            success=False,
+            message="Request data is empty",
+            status_code=400
+        )
+
+    required_fields = ['initial_amount', 'annual_rate', 'volatility', 'years']
+    missing_fields = [field for field in required_fields if field not in data]
+    if missing_fields:
+        return make_response(
+            success=False,
+            message=f"Missing required fields: {', '.join(missing_fields)}",
+            status_code=400
+        )
+
+    try:
+        seed = data.get('seed')
+        result = investment_engine.monte_carlo(
+            float(data['initial_amount']),
+            float(data['annual_rate']) / 100,
+            float(data['volatility']) / 100,
+            int(data['years']),
+            paths=int(data.get('paths', 10_000)),
+            contributions=float(data.get('contributions', 0.0)),
+            inflation=float(data.get('inflation_rate', 0.0)) / 100,
+            seed=int(seed) if seed is not None else None
+        )
+    except (ValueError, TypeError, OverflowError) as e:  # int() of an infinite JSON number overflows
+        return make_response(success=False, message=str(e), status_code=400)
+
+    return make_response(
+        success=True,
+        data={
+            "simulation_results": {
+                "summary": result.summary(),
+                "yearly_percentiles": result.yearly_percentiles()
+            },
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
+def profile_amount(profile):
+    """Portfolio value from the saved profile, if its assets answer is a number"""
+    try:
+        amount = float(str(profile.get('assets', '')).replace(',', '').strip())
+    except ValueError:
+        return None
+    return amount if np.isfinite(amount) and amount > 0 else None
+
+@engagement_bp.route('/portfolio_risk', methods=['POST'])
+@login_required
+def simulate_portfolio_risk():
+    """Simulate the risk of the portfolio matching a risk preference"""
+    data = request.get_json(silent=True) or {}
+    profile = session.get('user_profile', {}).get('raw_data', {})
+    risk_preference = str(data.get('risk_preference') or profile.get('risk_preference') or '').strip().lower()
+    if not risk_preference:
+        return make_response(
+            success=False,
+            message="Missing required information: risk_preference",
+            status_code=400
+        )
+
+    try:
+        amount = data.get('amount')
+        amount = float(amount) if amount not in (None, '') else profile_amount(profile)
+        seed = data.get('seed')
+        metrics = portfolio_risk.simulate_risk(
+            risk_preference,
+            years=int(data.get('years', 10)),
+            paths=int(data.get('paths', 100_000)),
+            amount=amount,
+            seed=int(seed) if seed is not None else None
+        )
+    except (ValueError, TypeError) as e:
+        return make_response(success=False, message=str(e), status_code=400)
+
+    return make_response(
+        success=True,
+        data={
+            "risk_simulation": metrics,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
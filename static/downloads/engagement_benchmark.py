@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync against async benchmark for the engagement blueprint
+
+Serves the engagement blueprint with a gunicorn worker in two ways and
+sends financial advice questions from many concurrent clients to each:
+
+    sync   gthread worker, WSGI; the async view runs on a new loop and
+           thread per request and calls Gemini through the requests pool
+    async  uvicorn worker, FlaskASGI; the view runs on the worker's loop
+           and calls Gemini through the loop's httpx.AsyncClient
+
+A local fake Gemini API answers after a fixed delay. Every question is
+unique, so the response cache never answers for it. Reports throughput
+and latency percentiles per mode and client count.
+
+    python engagement_benchmark.py --clients 10 100 500 --latency 0.2
+
+The sync worker gets --threads threads and as many pooled connections.
+GEMINI_MAX_IN_FLIGHT is raised to the largest client count unless it is
+set, otherwise the breaker sheds the excess calls with 503s.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+import httpx
+
+PERCENTILES = (50, 95, 99)
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODES = {
+    'sync': lambda threads: ['-k', 'gthread', '--threads', str(threads), 'engagement_benchmark:create_app()'],
+    'async': lambda threads: ['-k', 'uvicorn_worker.UvicornWorker', 'engagement_benchmark:create_asgi_app()'],
+}
+FAKE_ANSWER = b'{"candidates": [{"content": {"parts": [{"text": "Diversify."}]}}]}'
+
+
+async def fake_gemini(scope, receive, send):
+    """ASGI app answering every generateContent call after FAKE_GEMINI_LATENCY seconds"""
+    if scope['type'] != 'http':
+        return
+    while (await receive()).get('more_body'):
+        pass
+    await asyncio.sleep(float(os.environ.get('FAKE_GEMINI_LATENCY', 0.2)))
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': FAKE_ANSWER})
+
+
+def create_app():
+    """Engagement blueprint with logins disabled, calling the fake Gemini API"""
+    from flask import Flask
+    from flask_login import LoginManager
+    import ai_engagement_system as engagement
+
+    engagement.Config.GEMINI_API_URL = os.environ['BENCHMARK_GEMINI_URL']
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='benchmark', LOGIN_DISABLED=True)
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: None)
+    app.register_blueprint(engagement.engagement_bp, url_prefix='/engagement')
+    return app
+
+
+def create_asgi_app():
+    from flask_asgi import FlaskASGI
+    from ai_engagement_system import gemini_async_pool
+    return FlaskASGI(create_app(), startup=[gemini_async_pool.open], shutdown=[gemini_async_pool.close])
+
+
+def start(args, port, env):
+    process = subprocess.Popen(args, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{args[2]} exited during start-up")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{args[2]} did not start in time")
+
+
+def stop(process):
+    process.terminate()
+    process.wait()
+
+
+async def run_clients(url, clients, requests_per_client):
+    """Send requests from concurrent clients, return latencies, error count and elapsed time"""
+    latencies = []
+    errors = 0
+
+    async def client(number):
+        # A client per user, as one shared pool costs httpcore more CPU than the server
+        nonlocal errors
+        async with httpx.AsyncClient(timeout=120) as session:
+            for i in range(requests_per_client):
+                question = f"Client {number} question {i} at {time.perf_counter_ns()}"
+                started = time.perf_counter()
+                try:
+                    ok = (await session.post(url, json={"question": question})).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    return np.array(latencies), errors, time.perf_counter() - started
+
+
+def benchmark(modes, client_counts, requests_per_client, latency, threads, port):
+    """Print throughput and latency for each mode and number of concurrent clients"""
+    env = dict(os.environ, FAKE_GEMINI_LATENCY=str(latency), PYTHONPATH=HERE,
+               BENCHMARK_GEMINI_URL=f"http://127.0.0.1:{port + 1}/generateContent")
+    env.setdefault('GEMINI_API_KEY', 'benchmark')
+    env.setdefault('GEMINI_MAX_IN_FLIGHT', str(max(client_counts)))
+    env.setdefault('GEMINI_POOL_MAXSIZE', str(threads))
+    gemini = start([sys.executable, '-m', 'uvicorn', '--port', str(port + 1), '--log-level', 'warning',
+                    '--backlog', '4096', 'engagement_benchmark:fake_gemini'], port + 1, env)
+
+    print(f"fake Gemini latency {latency * 1000:.0f} ms, {requests_per_client} requests per client, "
+          f"{os.cpu_count()} CPUs, 1 worker, {threads} threads for sync")
+    try:
+        for mode in modes:
+            server = start([sys.executable, '-m', 'gunicorn', '-w', '1', '-b', f"127.0.0.1:{port}",
+                            '--backlog', '4096', '--timeout', '120'] + MODES[mode](threads), port, env)
+            try:
+                url = f"http://127.0.0.1:{port}/engagement/financial_advice"
+                for clients in client_counts:
+                    latencies, errors, elapsed = asyncio.run(run_clients(url, clients, requests_per_client))
+                    line = f"{mode:<5} clients={clients:<4} {latencies.size / elapsed:8.1f} req/s  errors={errors:<4}"
+                    if latencies.size:
+                        values = np.percentile(latencies, PERCENTILES) * 1000
+                        line += "  " + "  ".join(f"p{p}={v:7.1f} ms" for p, v in zip(PERCENTILES, values))
+                    print(line, flush=True)
+            finally:
+                stop(server)
+    finally:
+        stop(gemini)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the engagement blueprint, sync against async")
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--requests', type=int, default=5, help="Requests sent by each client")
+    parser.add_argument('--latency', type=float, default=0.2, help="Fake Gemini response time in seconds")
+    parser.add_argument('--threads', type=int, default=32, help="Threads of the sync worker")
+    parser.add_argument('--port', type=int, default=8898)
+    args = parser.parse_args()
+
+    benchmark(args.modes, args.clients, args.requests, args.latency, args.threads, args.port)
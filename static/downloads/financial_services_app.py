@@ -1,13 +1,17 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
-from engagement import engagement_bp
+import sys
+from engagement import engagement_bp, gemini_async_pool
 from support import support_bp
 from dashboard import dashboard_bp
+from user_store import db, SQLAlchemyUserStore, LoginThrottled
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
+from flask_asgi import FlaskASGI
+import ratelimit_storage  # noqa: F401  Registers the sqlite:// rate limit storage
 
 # Load environment variables
 load_dotenv()
@@ -15,6 +19,11 @@ load_dotenv()
 # Create Flask application
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///users.db')
+
+# Configure user storage
+db.init_app(app)
+user_store = SQLAlchemyUserStore()
 
 # Configure Flask-Login
 login_manager = LoginManager()
@@ -22,10 +31,26 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 # Configure rate limiter
+# Counters are kept in RATELIMIT_STORAGE_URI so every worker on the node shares
+# them. The default SQLite file (see ratelimit_storage) needs no server; use
+# redis:// to share limits between hosts. memory:// keeps separate counters per
+# process, multiplying every limit by the worker count, so it is refused under
+# gunicorn. There is no in-memory fallback for the same reason: an unreachable
+# store fails requests instead of quietly limiting per worker.
+# The sliding window counter strategy smooths bursts at window edges and costs
+# two counter reads per check; moving-window is exact but grows with the limit.
+RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'sqlite:///ratelimit.sqlite3')
+if RATELIMIT_STORAGE_URI.startswith('memory://') and (
+        'gunicorn' in sys.modules or 'gunicorn' in os.environ.get('SERVER_SOFTWARE', '')):
+    raise RuntimeError("RATELIMIT_STORAGE_URI is memory://, which gives every gunicorn worker its own "
+                       "rate limit counters; use the default sqlite:// store or redis://")
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter'),
+    headers_enabled=True
 )
 
 # Register blueprints
@@ -33,21 +58,18 @@ app.register_blueprint(engagement_bp, url_prefix='/engagement')
 app.register_blueprint(support_bp, url_prefix='/support')
 app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
 
-# Mock user database
-users = {
-    'mingkai': {
-        'password': generate_password_hash('wang'),
-        'id': 1
-    }
-}
-
-class User(UserMixin):
-    def __init__(self, user_id):
-        self.id = user_id
+# Create tables and the demo account
+with app.app_context():
+    db.create_all()
+    if not user_store.exists('mingkai'):
+        try:
+            user_store.create('mingkai', 'wang')
+        except IntegrityError:  # Created by another worker meanwhile
+            db.session.rollback()
 
 @login_manager.user_loader
-def load_user(user_id):
-    return User(user_id)
+def load_user(session_id):
+    return user_store.load_session(session_id)
 
 @app.route('/')
 def home():
@@ -62,14 +84,25 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        if email in users and check_password_hash(users[email]['password'], password or ''):
-            user = User(users[email]['id'])
+        try:
+            user = user_store.verify(email, password)
+        except LoginThrottled:
+            flash('Too many requests, please try again later')
+            return render_template('account.html'), 503
+
+        if user is not None:
             login_user(user)
             return redirect(url_for('index'))
         
         flash('Invalid email or password')
     return render_template('account.html')
 
+@app.route('/health')
+@limiter.exempt
+def health():
+    # Liveness probe, exempt from rate limits and login
+    return {'status': 'ok'}
+
 @app.route('/index')
 @login_required
 def index():
@@ -81,6 +114,14 @@ def logout():
     logout_user()
     return redirect(url_for('login'))
 
+@app.route('/logout/all', methods=['POST'])
+@login_required
+def logout_everywhere():
+    # Bumping the session version invalidates the user's other sessions too
+    user_store.revoke_sessions(current_user.id)
+    logout_user()
+    return redirect(url_for('login'))
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
     flash('Too many requests, please try again later')
@@ -96,12 +137,11 @@ def not_found_error(e):
     flash('Page not found')
     return redirect(url_for('login'))
 
+# ASGI entry point, serves the async views on the worker's event loop:
+# gunicorn -k uvicorn_worker.UvicornWorker financial_services_app:asgi_app
+asgi_app = FlaskASGI(app, startup=[gemini_async_pool.open], shutdown=[gemini_async_pool.close])
+
 if __name__ == '__main__':
-    # Set application configuration
-    app.config['RATELIMIT_HEADERS_ENABLED'] = True
-    app.config['RATELIMIT_STORAGE_URL'] = 'memory://'
-    app.config['RATELIMIT_STRATEGY'] = 'fixed-window'
-    
     # Start application
     app.run(debug=False, port=8888)
 
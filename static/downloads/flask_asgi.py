@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASGI adapter for the financial services app
+
+Flask runs an ``async def`` view through asgiref, which starts a new event
+loop on a thread of its own for every request, so under a WSGI server an
+async view holds worker threads for as long as a sync one. FlaskASGI serves
+a Flask app from an ASGI server instead. Requests routed to an async view
+are dispatched on the server's event loop, where a worker can wait on
+hundreds of upstream calls at once and clients bound to the loop are reused
+between requests. Every other request runs the WSGI app on a thread pool,
+as do streamed response bodies, which may block while they are generated.
+
+Request hooks, session handling and the sync parts of async views run on
+the loop and have to stay short.
+
+    gunicorn -k uvicorn_worker.UvicornWorker financial_services_app:asgi_app
+"""
+import os
+import sys
+import asyncio
+import inspect
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from flask import request_started
+from werkzeug.exceptions import HTTPException
+
+SYNC_THREADS = int(os.environ.get("ASGI_SYNC_THREADS", 32))  # Threads per worker for sync views
+BODY_SPOOL_SIZE = 64 * 1024  # Request bodies above this are buffered on disk
+
+# True while a request is dispatched on the event loop, see FlaskASGI.ensure_sync
+_on_loop = contextvars.ContextVar('flask_asgi_on_loop', default=False)
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and its request body"""
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+    path_info = scope['path'].encode('utf-8').decode('latin-1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f"HTTP_{name}"
+        value = value.decode('latin-1')
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def start_message(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    }
+
+
+class FlaskASGI:
+    """ASGI application running a Flask app's async views on the event loop.
+
+    ``startup`` and ``shutdown`` are callables (plain or async) run from
+    the server's lifespan events, on the loop that serves the requests.
+    """
+
+    def __init__(self, app, startup=(), shutdown=(), threads=SYNC_THREADS):
+        self.app = app
+        self.startup = list(startup)
+        self.shutdown = list(shutdown)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='flask-asgi')
+        self._async_endpoints = {}
+        # Flask documents ensure_sync as the hook for changing how async views run
+        self._ensure_sync = app.ensure_sync
+        app.ensure_sync = self.ensure_sync
+
+    def ensure_sync(self, func):
+        """Hand coroutine functions back unchanged when dispatching on the event loop"""
+        if _on_loop.get() and inspect.iscoroutinefunction(func):
+            return func
+        return self._ensure_sync(func)
+
+    def is_async_view(self, environ):
+        """True when the request is routed to an ``async def`` view"""
+        adapter = self.app.url_map.bind_to_environ(environ, server_name=self.app.config['SERVER_NAME'])
+        try:
+            endpoint, _ = adapter.match()
+        except HTTPException:
+            return False
+        if endpoint not in self._async_endpoints:
+            view = self.app.view_functions.get(endpoint)
+            self._async_endpoints[endpoint] = view is not None and inspect.iscoroutinefunction(inspect.unwrap(view))
+        return self._async_endpoints[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']}")
+
+        loop = asyncio.get_running_loop()
+        with SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            environ = build_environ(scope, body)
+
+            if not self.is_async_view(environ):
+                await self.run_sync(loop, self.run_wsgi, environ, send, loop)
+                return
+
+            response = await self.dispatch(environ)
+            app_iter, status, headers = response.get_wsgi_response(environ)
+            if response.is_streamed:
+                start = start_message(status, headers)
+                await self.run_sync(loop, self.send_body, app_iter, lambda: start, send, loop)
+                return
+            try:
+                await send(start_message(status, headers))
+                for chunk in app_iter:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body'})
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+
+    def run_sync(self, loop, func, *args):
+        return loop.run_in_executor(self.executor, contextvars.copy_context().run, func, *args)
+
+    async def dispatch(self, environ):
+        """Handle a request like Flask.wsgi_app does, awaiting the view on this loop"""
+        app = self.app
+        token = _on_loop.set(True)
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                response = await self.full_dispatch_request()
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            except:  # noqa: E722
+                error = sys.exc_info()[1]
+                raise
+            return response
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+            _on_loop.reset(token)
+
+    async def full_dispatch_request(self):
+        app = self.app
+        try:
+            request_started.send(app, _async_wrapper=app.ensure_sync)
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = app.dispatch_request()
+                if inspect.isawaitable(rv):
+                    rv = await rv
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+            if inspect.isawaitable(rv):
+                rv = await rv
+        return app.finalize_request(rv)
+
+    def run_wsgi(self, environ, send, loop):
+        """Run the WSGI app on a pool thread and send its response"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['message'] = start_message(status, headers)
+
+        app_iter = self.app(environ, start_response)
+        self.send_body(app_iter, lambda: started['message'], send, loop)
+
+    def send_body(self, app_iter, start, send, loop):
+        """Send a response from a pool thread, pulling the body chunk by chunk.
+
+        ``start`` returns the response start message; a WSGI app may only
+        call start_response once the first chunk is pulled.
+        """
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        sent_start = False
+        try:
+            for chunk in app_iter:
+                if not sent_start:
+                    send_sync(start())
+                    sent_start = True
+                if chunk:
+                    send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_start:
+                send_sync(start())
+            send_sync({'type': 'http.response.body'})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    for func in self.startup:
+                        result = func()
+                        if inspect.isawaitable(result):
+                            await result
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for func in self.shutdown:
+                    result = func()
+                    if inspect.isawaitable(result):
+                        await result
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorised investment simulation engine
+
+Balances of many scenarios are computed in one NumPy pass instead of a
+Python loop per scenario and year. With yearly growth factors
+G_t = (1 + r_1) * ... * (1 + r_t) and contributions c_t paid at the end of
+year t, the balance after t years is
+
+    V_t = G_t * (P + sum(c_s / G_s for s <= t))
+
+which is a cumulative product and a cumulative sum over the year axis, for
+fixed rates as well as for stochastic Monte Carlo returns.
+"""
+import numpy as np
+
+MAX_YEARS = 100
+MAX_SCENARIOS = 1_000_000
+MAX_PATHS = 200_000
+MAX_CELLS = 5_000_000  # Scenarios x years per request, each result matrix is 8 bytes per cell
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Lowest yearly return a Monte Carlo draw may take, keeps growth factors positive
+MIN_RETURN = -0.99
+
+
+def _as_array(name, value, dtype=np.float64):
+    try:
+        array = np.asarray(value, dtype=dtype)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid number format in {name}")
+    if array.ndim > 1:
+        raise ValueError(f"{name} must be a number or a list of numbers")
+    if not np.all(np.isfinite(array)):
+        raise ValueError(f"{name} must contain finite numbers")
+    return array
+
+
+def _as_number(name, value):
+    array = _as_array(name, value)
+    if array.ndim != 0:
+        raise ValueError(f"{name} must be a number")
+    return float(array)
+
+
+def _check_finite(*matrices):
+    """Reject results that overflowed, e.g. extreme rates over long horizons"""
+    for matrix in matrices:
+        if not np.all(np.isfinite(matrix)):
+            raise ValueError("Results are too large to represent, lower the rates or the number of years")
+
+
+def check_size(count, horizon):
+    """Reject batches whose result matrices would be too large to hold"""
+    if count > MAX_SCENARIOS:
+        raise ValueError(f"At most {MAX_SCENARIOS} scenarios can be simulated at once")
+    if count * horizon > MAX_CELLS:
+        raise ValueError(f"Scenarios times years cannot exceed {MAX_CELLS}")
+
+
+def scenarios(initial_amounts, annual_rates, years, contributions=0.0, inflation=0.0, grid=False):
+    """Validate scenario inputs and broadcast them to arrays of equal length.
+
+    Each argument is a number or a list. Lists are matched element-wise, or
+    combined into every combination when ``grid`` is true. Rates, contributions
+    and inflation are yearly decimals and amounts; years are whole years.
+    """
+    initial_amounts = _as_array("initial_amounts", initial_amounts)
+    annual_rates = _as_array("annual_rates", annual_rates)
+    contributions = _as_array("contributions", contributions)
+    inflation = _as_array("inflation", inflation)
+    years = _as_array("years", years)
+    if 0 in (initial_amounts.size, annual_rates.size, contributions.size, inflation.size, years.size):
+        raise ValueError("Scenario lists cannot be empty")
+    if np.any(years != np.round(years)):
+        raise ValueError("years must be whole numbers")
+    years = years.astype(np.int64)
+    if np.any(years <= 0) or np.any(years > MAX_YEARS):
+        raise ValueError(f"Years must be between 1 and {MAX_YEARS}")
+
+    # Size the request before anything is expanded
+    inputs = [np.atleast_1d(a) for a in (initial_amounts, annual_rates, years, contributions, inflation)]
+    if grid:
+        count = int(np.prod([a.size for a in inputs], dtype=object))
+    else:
+        try:
+            count = int(np.prod(np.broadcast_shapes(*[a.shape for a in inputs])))
+        except ValueError:
+            raise ValueError("Scenario lists must have the same length")
+    check_size(count, int(years.max()))
+
+    if grid:
+        inputs = [a.ravel() for a in np.meshgrid(*inputs, indexing='ij')]
+    inputs = np.broadcast_arrays(*inputs)
+    initial_amounts, annual_rates, years, contributions, inflation = (np.array(a) for a in inputs)
+
+    if np.any(initial_amounts <= 0):
+        raise ValueError("Initial amounts must be positive")
+    if np.any(annual_rates <= -1) or np.any(inflation <= -1):
+        raise ValueError("Rates must be greater than -100%")
+    if np.any(contributions < 0):
+        raise ValueError("Contributions cannot be negative")
+    return initial_amounts, annual_rates, years, contributions, inflation
+
+
+def contribution_matrix(contributions, horizon, schedule=None):
+    """Contribution paid at the end of every year, shape (scenarios, horizon).
+
+    ``schedule`` optionally overrides the flat yearly contributions with an
+    amount per year, shared by all scenarios (1-D) or per scenario (2-D).
+    """
+    if schedule is None:
+        return np.broadcast_to(contributions[:, None], (contributions.size, horizon))
+    schedule = np.asarray(schedule, dtype=np.float64)
+    if schedule.ndim not in (1, 2) or schedule.shape[-1] < horizon:
+        raise ValueError(f"Contribution schedule must cover {horizon} years")
+    if np.any(schedule < 0) or not np.all(np.isfinite(schedule)):
+        raise ValueError("Contribution schedule must contain non-negative numbers")
+    try:
+        return np.broadcast_to(schedule[..., :horizon], (contributions.size, horizon))
+    except ValueError:
+        raise ValueError("Contribution schedule needs one row per scenario")
+
+
+def project_balances(initial_amounts, factors, contributions):
+    """Balances after every year given cumulative growth factors"""
+    discounted = np.cumsum(contributions / factors, axis=1)
+    return factors * (initial_amounts[:, None] + discounted)
+
+
+class SimulationResult:
+    """Yearly balances of a batch of fixed-rate scenarios"""
+
+    def __init__(self, initial_amounts, annual_rates, years, balances, real_balances, contributed):
+        self.initial_amounts = initial_amounts
+        self.annual_rates = annual_rates
+        self.years = years
+        self.balances = balances            # Nominal, shape (scenarios, max(years))
+        self.real_balances = real_balances  # In today's money
+        self.contributed = contributed      # Cumulative contributions
+
+    def __len__(self):
+        return self.years.size
+
+    def _at_horizon(self, matrix):
+        return matrix[np.arange(self.years.size), self.years - 1]
+
+    @property
+    def final_amounts(self):
+        return self._at_horizon(self.balances)
+
+    @property
+    def real_final_amounts(self):
+        return self._at_horizon(self.real_balances)
+
+    @property
+    def total_invested(self):
+        return self.initial_amounts + self._at_horizon(self.contributed)
+
+    def yearly_breakdown(self, index):
+        """Year-by-year rows of one scenario, as returned by the API"""
+        years = int(self.years[index])
+        amounts = np.round(self.balances[index, :years], 2)
+        growth = np.round(self.balances[index, :years] - self.initial_amounts[index]
+                          - self.contributed[index, :years], 2)
+        return [{'year': year, 'amount': float(amount), 'growth': float(gain)}
+                for year, amount, gain in zip(range(1, years + 1), amounts, growth)]
+
+    def summary(self):
+        final = self.final_amounts
+        return {
+            "scenarios": len(self),
+            "final_amount": _describe(final),
+            "real_final_amount": _describe(self.real_final_amounts),
+            "roi_percentage": _describe((final / self.total_invested - 1) * 100)
+        }
+
+
+def simulate(initial_amounts, annual_rates, years, contributions=0.0, inflation=0.0,
+             contribution_schedule=None, grid=False):
+    """Simulate fixed-rate compound growth for a batch of scenarios"""
+    initial_amounts, annual_rates, years, contributions, inflation = scenarios(
+        initial_amounts, annual_rates, years, contributions, inflation, grid)
+    horizon = int(years.max())
+    periods = np.arange(1, horizon + 1)
+
+    paid = contribution_matrix(contributions, horizon, contribution_schedule)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        factors = (1 + annual_rates[:, None]) ** periods
+        balances = project_balances(initial_amounts, factors, paid)
+        real_balances = balances / (1 + inflation[:, None]) ** periods
+    _check_finite(balances, real_balances)
+    return SimulationResult(initial_amounts, annual_rates, years, balances, real_balances,
+                            np.cumsum(paid, axis=1))
+
+
+class MonteCarloResult:
+    """Distribution of balances over simulated return paths"""
+
+    def __init__(self, initial_amount, years, balances, real_balances, contributed):
+        self.initial_amount = initial_amount
+        self.years = years
+        self.balances = balances            # Shape (paths, years)
+        self.real_balances = real_balances
+        self.contributed = contributed      # Cumulative contributions per year
+
+    def yearly_percentiles(self):
+        """Balance percentiles for every year, keyed by percentile"""
+        values = np.percentile(self.balances, PERCENTILES, axis=0)
+        return {f"p{p}": np.round(row, 2).tolist() for p, row in zip(PERCENTILES, values)}
+
+    def summary(self):
+        final = self.balances[:, -1]
+        invested = self.initial_amount + self.contributed[-1]
+        return {
+            "paths": int(final.size),
+            "years": self.years,
+            "final_amount": _describe(final),
+            "real_final_amount": _describe(self.real_balances[:, -1]),
+            "probability_of_loss": round(float(np.mean(final < invested)), 4),
+            "total_invested": round(float(invested), 2)
+        }
+
+
+def monte_carlo(initial_amount, mean_return, volatility, years, paths=10_000,
+                contributions=0.0, inflation=0.0, seed=None):
+    """Simulate one investment over random yearly returns.
+
+    Returns are drawn independently per path and year from a normal
+    distribution with the given mean and volatility (decimals).
+    """
+    initial_amount = _as_number("initial_amount", initial_amount)
+    mean_return = _as_number("mean_return", mean_return)
+    volatility = _as_number("volatility", volatility)
+    contributions = _as_number("contributions", contributions)
+    inflation = _as_number("inflation", inflation)
+    years = int(_as_number("years", years))
+    paths = int(_as_number("paths", paths))
+    if initial_amount <= 0:
+        raise ValueError("Initial amount must be positive")
+    if volatility < 0:
+        raise ValueError("Volatility cannot be negative")
+    if contributions < 0:
+        raise ValueError("Contributions cannot be negative")
+    if inflation <= -1:
+        raise ValueError("Inflation must be greater than -100%")
+    if not 1 <= years <= MAX_YEARS:
+        raise ValueError(f"Years must be between 1 and {MAX_YEARS}")
+    if not 1 <= paths <= MAX_PATHS:
+        raise ValueError(f"Paths must be between 1 and {MAX_PATHS}")
+    check_size(paths, years)
+
+    rng = np.random.default_rng(seed)
+    paid = np.full((1, years), contributions)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        returns = rng.normal(mean_return, volatility, size=(paths, years))
+        np.maximum(returns, MIN_RETURN, out=returns)
+        factors = np.cumprod(1 + returns, axis=1)
+        balances = project_balances(np.array([initial_amount]), factors, paid)
+        real_balances = balances / (1 + inflation) ** np.arange(1, years + 1)
+    _check_finite(balances, real_balances)
+    return MonteCarloResult(initial_amount, years, balances, real_balances, np.cumsum(paid[0]))
+
+
+def _describe(values):
+    percentiles = np.percentile(values, PERCENTILES)
+    result = {"mean": round(float(values.mean()), 2)}
+    result.update({f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, percentiles)})
+    return result
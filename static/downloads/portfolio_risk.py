@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo portfolio risk simulator
+
+Turns a risk preference (conservative, moderate or aggressive) into an asset
+allocation and simulates correlated monthly asset returns for it, giving the
+distribution of horizon returns, Value at Risk, Conditional VaR and maximum
+drawdowns. Everything runs locally, no API calls are needed.
+
+Paths are simulated in fixed-size chunks, each with its own random stream
+spawned from the seed, so results for a seed are identical whatever the
+number of worker processes. Large runs are spread over a process pool and
+every worker writes its chunk straight into a shared-memory result buffer.
+Pool workers are started from a forkserver, so they never inherit the web
+worker's threads, sockets or locks.
+
+Run this file directly to benchmark scaling with the number of workers:
+
+    python portfolio_risk.py --paths 200000 --workers 1 2 4
+"""
+import os
+import time
+import atexit
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+ASSETS = ('equities', 'bonds', 'cash')
+
+# Yearly expected return and volatility of every asset class
+ASSET_RETURNS = np.array([0.07, 0.03, 0.015])
+ASSET_VOLATILITY = np.array([0.16, 0.06, 0.01])
+ASSET_CORRELATION = np.array([
+    [1.0, 0.2, 0.0],
+    [0.2, 1.0, 0.1],
+    [0.0, 0.1, 1.0],
+])
+
+# Asset allocation for each risk preference
+RISK_PROFILES = {
+    'conservative': np.array([0.25, 0.60, 0.15]),
+    'moderate': np.array([0.55, 0.40, 0.05]),
+    'aggressive': np.array([0.85, 0.15, 0.00]),
+}
+
+CONFIDENCE_LEVELS = (0.95, 0.99)
+PERCENTILES = (5, 25, 50, 75, 95)
+CHUNK_PATHS = 5000        # Paths per chunk, fixed so results do not depend on the worker count
+PARALLEL_MIN_PATHS = 50_000  # Smaller runs are not worth the process pool overhead
+MAX_PATHS = 200_000
+MAX_YEARS = 50
+MAX_PATH_YEARS = 2_000_000  # Paths times years per request, bounds the CPU time of one call
+WORKERS = int(os.environ.get("RISK_SIMULATION_WORKERS", min(4, os.cpu_count() or 1)))
+POOL_START_METHOD = os.environ.get("RISK_SIMULATION_START_METHOD", "forkserver")  # forkserver or spawn
+
+# Columns of the result buffer
+FINAL_RETURN, MAX_DRAWDOWN = 0, 1
+
+
+def monthly_parameters(weights):
+    """Monthly mean returns and Cholesky factor of the asset covariance"""
+    covariance = np.outer(ASSET_VOLATILITY, ASSET_VOLATILITY) * ASSET_CORRELATION
+    return ASSET_RETURNS / 12, np.linalg.cholesky(covariance / 12), weights
+
+
+def simulate_chunk(out, months, seed_sequence, parameters):
+    """Simulate len(out) paths and write final return and max drawdown into out"""
+    means, cholesky, weights = parameters
+    rng = np.random.default_rng(seed_sequence)
+    shocks = rng.standard_normal((out.shape[0], months, len(ASSETS)))
+    asset_returns = means + shocks @ cholesky.T
+    portfolio_returns = np.maximum(asset_returns @ weights, -0.99)
+
+    wealth = np.cumprod(1 + portfolio_returns, axis=1)
+    peaks = np.maximum(np.maximum.accumulate(wealth, axis=1), 1.0)
+    out[:, FINAL_RETURN] = wealth[:, -1] - 1
+    out[:, MAX_DRAWDOWN] = np.max(1 - wealth / peaks, axis=1)
+
+
+def _simulate_shared(shm_name, total_paths, start, stop, months, seed_sequence, parameters):
+    """Process pool task writing one chunk into the shared result buffer"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        results = np.ndarray((total_paths, 2), dtype=np.float64, buffer=shm.buf)
+        simulate_chunk(results[start:stop], months, seed_sequence, parameters)
+        del results
+    finally:
+        shm.close()
+    return stop - start
+
+
+class RiskSimulator:
+    """Runs chunked simulations, in process or on a lazily started process pool"""
+
+    def __init__(self, workers=WORKERS, start_method=POOL_START_METHOD):
+        self.workers = max(1, int(workers))
+        self.start_method = start_method
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(self.start_method))
+        return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def run(self, risk_preference, years, paths, seed=None):
+        """Return a (paths, 2) array of final returns and maximum drawdowns"""
+        if risk_preference not in RISK_PROFILES:
+            raise ValueError(f"Risk preference must be one of: {', '.join(RISK_PROFILES)}")
+        if not 1 <= years <= MAX_YEARS:
+            raise ValueError(f"Years must be between 1 and {MAX_YEARS}")
+        if not 1 <= paths <= MAX_PATHS:
+            raise ValueError(f"Paths must be between 1 and {MAX_PATHS}")
+        if paths * years > MAX_PATH_YEARS:
+            raise ValueError(f"Paths times years cannot exceed {MAX_PATH_YEARS}")
+
+        months = years * 12
+        parameters = monthly_parameters(RISK_PROFILES[risk_preference])
+        bounds = [(start, min(start + CHUNK_PATHS, paths)) for start in range(0, paths, CHUNK_PATHS)]
+        seeds = np.random.SeedSequence(seed).spawn(len(bounds))
+
+        if self.workers == 1 or paths < PARALLEL_MIN_PATHS:
+            results = np.empty((paths, 2), dtype=np.float64)
+            for (start, stop), chunk_seed in zip(bounds, seeds):
+                simulate_chunk(results[start:stop], months, chunk_seed, parameters)
+            return results
+
+        shm = shared_memory.SharedMemory(create=True, size=paths * 2 * 8)
+        try:
+            shared = np.ndarray((paths, 2), dtype=np.float64, buffer=shm.buf)
+            pool = self.pool()
+            futures = [pool.submit(_simulate_shared, shm.name, paths, start, stop, months, chunk_seed, parameters)
+                       for (start, stop), chunk_seed in zip(bounds, seeds)]
+            for future in futures:
+                future.result()
+            results = shared.copy()
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+        return results
+
+
+simulator = RiskSimulator()
+atexit.register(simulator.close)
+
+
+def risk_metrics(results, amount=None):
+    """VaR, CVaR, return and drawdown distributions of simulated paths.
+
+    VaR and CVaR are reported as positive loss fractions of the initial value,
+    and also as money when ``amount`` is given.
+    """
+    returns = results[:, FINAL_RETURN]
+    drawdowns = results[:, MAX_DRAWDOWN]
+
+    metrics = {"paths": int(returns.size), "value_at_risk": {}, "conditional_value_at_risk": {}}
+    for level in CONFIDENCE_LEVELS:
+        cutoff = np.quantile(returns, 1 - level)
+        tail = returns[returns <= cutoff]
+        name = f"{int(level * 100)}%"
+        metrics["value_at_risk"][name] = round(float(-cutoff), 4)
+        metrics["conditional_value_at_risk"][name] = round(float(-tail.mean()), 4)
+
+    metrics["horizon_return"] = _describe(returns)
+    metrics["max_drawdown"] = _describe(drawdowns)
+    metrics["probability_of_loss"] = round(float(np.mean(returns < 0)), 4)
+
+    if amount is not None:
+        metrics["value_at_risk_amount"] = {name: round(value * amount, 2)
+                                           for name, value in metrics["value_at_risk"].items()}
+        metrics["conditional_value_at_risk_amount"] = {name: round(value * amount, 2)
+                                                       for name, value in metrics["conditional_value_at_risk"].items()}
+    return metrics
+
+
+def simulate_risk(risk_preference, years=10, paths=100_000, amount=None, seed=None):
+    """Simulate a risk profile and summarise its risk metrics"""
+    results = simulator.run(risk_preference, int(years), int(paths), seed)
+    metrics = risk_metrics(results, amount)
+    metrics["risk_preference"] = risk_preference
+    metrics["years"] = int(years)
+    metrics["allocation"] = dict(zip(ASSETS, RISK_PROFILES[risk_preference].tolist()))
+    return metrics
+
+
+def _describe(values):
+    percentiles = np.percentile(values, PERCENTILES)
+    result = {"mean": round(float(values.mean()), 4)}
+    result.update({f"p{p}": round(float(v), 4) for p, v in zip(PERCENTILES, percentiles)})
+    return result
+
+
+def benchmark(paths, years, worker_counts, seed=0):
+    """Time one simulation per worker count and print the speedup"""
+    baseline = None
+    reference = None
+    print(f"{paths} paths, {years} years, {os.cpu_count()} CPUs")
+    for workers in worker_counts:
+        runner = RiskSimulator(workers)
+        runner.run('moderate', years, PARALLEL_MIN_PATHS, seed)  # Start the pool before timing
+        started = time.perf_counter()
+        results = runner.run('moderate', years, paths, seed)
+        elapsed = time.perf_counter() - started
+        runner.close()
+
+        baseline = baseline or elapsed
+        if reference is None:
+            reference = results
+        identical = np.array_equal(results, reference)
+        print(f"workers={workers:<3} {elapsed:8.3f}s  speedup={baseline / elapsed:5.2f}x  "
+              f"identical={identical}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the portfolio risk simulator")
+    parser.add_argument('--paths', type=int, default=MAX_PATHS)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    benchmark(args.paths, args.years, args.workers)
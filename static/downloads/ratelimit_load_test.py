@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-process load test for the login rate limit
+
+Starts financial_services_app under gunicorn with several workers, clears
+the limiter's counters and sends login page requests from several client
+processes at once. /login allows 10 requests per minute per client address,
+so across all workers at most 10 requests may succeed; limited requests are
+redirected back to the login page by the 429 handler.
+
+    python ratelimit_load_test.py --storage sqlite:///ratelimit.sqlite3 --workers 4
+
+memory:// would let every worker count on its own, up to 10 times the
+worker count getting through, so the app refuses to start with it.
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from multiprocessing import Pool
+import requests
+from limits.storage import storage_from_string
+import ratelimit_storage  # noqa: F401  Registers sqlite://
+
+LOGIN_LIMIT = 10  # Matches @limiter.limit("10 per minute") on /login
+
+
+def send(args):
+    """Send requests with a fresh connection each, return the status codes"""
+    url, count = args
+    statuses = []
+    for _ in range(count):
+        try:
+            statuses.append(requests.get(url, allow_redirects=False, timeout=10).status_code)
+        except requests.RequestException:
+            statuses.append(None)
+    return statuses
+
+
+def wait_until_up(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during start-up")
+        try:
+            # Not followed, a redirect to /login would count against its limit
+            if requests.get(url, allow_redirects=False, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def load_test(storage, workers, clients, requests_per_client, port):
+    """Return the number of /login requests let through across all workers"""
+    env = dict(os.environ, RATELIMIT_STORAGE_URI=storage)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f"127.0.0.1:{port}",
+         'financial_services_app:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    try:
+        # Probe the route exempt from limits, then start from empty counters
+        wait_until_up(f"http://127.0.0.1:{port}/health", process)
+        storage_from_string(storage).reset()
+
+        url = f"http://127.0.0.1:{port}/login"
+        started = time.perf_counter()
+        with Pool(clients) as pool:
+            results = pool.map(send, [(url, requests_per_client)] * clients)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+    statuses = [status for result in results for status in result]
+    allowed = statuses.count(200)
+    limited = statuses.count(302)
+    failed = len(statuses) - allowed - limited
+    print(f"storage={storage} workers={workers} clients={clients}: {len(statuses)} requests "
+          f"in {elapsed:.1f}s, allowed={allowed} limited={limited} failed={failed}")
+    return allowed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that rate limits hold across gunicorn workers")
+    parser.add_argument('--storage', default=os.getenv('RATELIMIT_STORAGE_URI', 'sqlite:///ratelimit.sqlite3'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8, help="Client processes sending requests")
+    parser.add_argument('--requests', type=int, default=20, help="Requests sent by each client")
+    parser.add_argument('--port', type=int, default=8899)
+    args = parser.parse_args()
+
+    allowed = load_test(args.storage, args.workers, args.clients, args.requests, args.port)
+    if allowed > LOGIN_LIMIT:
+        print(f"FAIL: {allowed} requests got through a limit of {LOGIN_LIMIT} per minute")
+        sys.exit(1)
+    print(f"OK: the limit of {LOGIN_LIMIT} per minute held across {args.workers} workers")
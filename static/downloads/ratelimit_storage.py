@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite storage for the rate limiter
+
+Keeps the limiter's counters in a SQLite file so every worker process on a
+host shares them without running a separate server. Importing this module
+registers the ``sqlite://`` scheme with limits:
+
+    RATELIMIT_STORAGE_URI=sqlite:///ratelimit.sqlite3         (relative path)
+    RATELIMIT_STORAGE_URI=sqlite:////var/lib/app/ratelimit.sqlite3
+
+Supports the fixed window and sliding window counter strategies. A sliding
+window hit is checked and counted in one write transaction, so concurrent
+workers cannot both take the last slot. Counters are not shared between
+hosts; use Redis for that.
+"""
+import os
+import time
+import sqlite3
+import threading
+from math import floor
+from limits.storage.base import Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """Rate limit counters shared by all workers on a host through a SQLite file"""
+
+    STORAGE_SCHEME = ["sqlite"]
+    PURGE_EVERY = 1000  # Writes between purges of expired counters
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len("sqlite:///"):] if uri.startswith("sqlite:///") else uri[len("sqlite://"):]
+        if not self.path:
+            raise ValueError("sqlite:// rate limit storage needs a file path, e.g. sqlite:///ratelimit.sqlite3")
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ratelimit ("
+                "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # Connections are per thread and per process, gunicorn may fork after import
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _incr(self, conn, key, expiry, amount, now):
+        """Add to a counter, starting it over when it has expired"""
+        count, = conn.execute(
+            "INSERT INTO ratelimit (key, count, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+            "RETURNING count",
+            (key, amount, now + expiry, now, now)
+        ).fetchone()
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM ratelimit WHERE expires_at <= ?", (now,))
+        return count
+
+    def _get(self, conn, key, now):
+        row = conn.execute("SELECT count FROM ratelimit WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key, expiry, amount=1):
+        with self._connect() as conn:
+            return self._incr(conn, key, expiry, amount, time.time())
+
+    def get(self, key):
+        return self._get(self._connect(), key, time.time())
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT expires_at FROM ratelimit WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._connect().execute("SELECT 1 FROM ratelimit LIMIT 1").fetchall()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM ratelimit").rowcount
+
+    def clear(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ratelimit WHERE key = ?", (key,))
+
+    def _sliding_window(self, conn, key, expiry, now):
+        """Previous count and TTL, current count and TTL, weighted like limits' memory storage"""
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._get(conn, previous_key, now)
+        current_count = self._get(conn, current_key, now)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        conn = self._connect()
+        with conn:
+            # Hold the write lock from the read to the increment
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            previous_count, previous_ttl, current_count, _ = self._sliding_window(conn, key, expiry, now)
+            if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                return False
+            # The current window is still the previous one for the next window
+            self._incr(conn, self.sliding_window_keys(key, expiry, now)[1], 2 * expiry, amount, now)
+            return True
+
+    def get_sliding_window(self, key, expiry):
+        return self._sliding_window(self._connect(), key, expiry, time.time())
+
+    def clear_sliding_window(self, key, expiry):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ratelimit WHERE key IN (?, ?)", self.sliding_window_keys(key, expiry, time.time()))
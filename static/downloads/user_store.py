@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+User storage for the financial services app
+
+Users are loaded through a UserStore, which keeps a bounded LRU cache of
+identities in front of its backend so authenticated requests do not hit the
+database every time. Session IDs carry a per-user session version
+("<id>:<version>"); bumping the version revokes every existing session of
+that user. Password hashing parameters are configurable, and hash checks are
+limited per worker so login bursts cannot take every CPU.
+
+Run this file directly to time password hashing for a few work factors:
+
+    python user_store.py 200000 600000 1000000
+"""
+import os
+import sys
+import hmac
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')  # Include the work factor
+HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', 2))  # Simultaneous hash checks per worker
+HASH_WAIT_SECONDS = 2       # Time a login waits for a hash slot before giving up
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 1024))
+IDENTITY_CACHE_TTL = 5      # Seconds a cached user is trusted, bounds revocation delay across workers
+
+db = SQLAlchemy()
+
+
+class UserRecord(db.Model):
+    __tablename__ = 'users'
+
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    password_hash = db.Column(db.String(255), nullable=False)
+    session_version = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class User(UserMixin):
+    def __init__(self, user_id, email, session_version):
+        self.id = user_id
+        self.email = email
+        self.session_version = session_version
+
+    def get_id(self):
+        # Old session versions stop loading once the version is bumped
+        return f"{self.id}:{self.session_version}"
+
+
+class LoginThrottled(Exception):
+    """Raised when no password hash slot frees up in time"""
+
+
+class UserStore:
+    """Looks up users through a bounded LRU cache in front of a backend.
+
+    Backends implement ``_load``, ``_find``, ``_create``, ``_set_password``
+    and ``_bump_version``. Cache entries expire after ``ttl`` seconds, so a
+    revocation made by another worker takes effect within that time; in
+    this worker it is immediate.
+    """
+
+    def __init__(self, cache_size=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL,
+                 hash_method=PASSWORD_HASH_METHOD, hash_concurrency=HASH_CONCURRENCY):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.hash_method = hash_method
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._hash_slots = threading.BoundedSemaphore(hash_concurrency)
+        # Hash a throwaway password once, for timing unknown emails and for the
+        # prefix ("pbkdf2:sha256:600000", "scrypt:32768:8:1") of current hashes
+        self._dummy_hash = generate_password_hash(os.urandom(16).hex(), method=hash_method)
+        self._hash_prefix = self._dummy_hash.split('$')[0] + '$'
+
+    def get(self, user_id):
+        """Return the user with this ID, from the cache when possible"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and now - cached[1] < self.ttl:
+                self._cache.move_to_end(user_id)
+                return cached[0]
+
+        user = self._load(user_id)
+        with self._lock:
+            if user is None:
+                self._cache.pop(user_id, None)
+            else:
+                self._cache[user_id] = (user, now)
+                self._cache.move_to_end(user_id)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def load_session(self, session_id):
+        """Return the user of a session ID, or None if it is malformed or revoked"""
+        user_id, _, version = str(session_id).partition(':')
+        if not user_id.isdigit() or not version:
+            return None
+        user = self.get(int(user_id))
+        if user is None:
+            return None
+        if not hmac.compare_digest(version.encode(), str(user.session_version).encode()):
+            return None
+        return user
+
+    def _check_password(self, password_hash, password):
+        """Return (matches, new_hash), new_hash being set when the stored hash is outdated"""
+        if not self._hash_slots.acquire(timeout=HASH_WAIT_SECONDS):
+            raise LoginThrottled("Too many logins in progress")
+        try:
+            if not check_password_hash(password_hash, password):
+                return False, None
+            if password_hash.startswith(self._hash_prefix):
+                return True, None
+            return True, generate_password_hash(password, method=self.hash_method)
+        finally:
+            self._hash_slots.release()
+
+    def verify(self, email, password):
+        """Return the user if the password matches, otherwise None"""
+        record = self._find(email or '')
+        if record is None:
+            # Check a throwaway hash so unknown emails take as long as wrong passwords
+            self._check_password(self._dummy_hash, password or '')
+            return None
+        user_id, password_hash = record
+        matches, new_hash = self._check_password(password_hash, password or '')
+        if not matches:
+            return None
+        # Store the rehash of a password saved with an older method or work factor
+        if new_hash is not None:
+            self._set_password(user_id, new_hash)
+        return self.get(user_id)
+
+    def exists(self, email):
+        return self._find(email) is not None
+
+    def create(self, email, password):
+        return self._create(email, generate_password_hash(password, method=self.hash_method))
+
+    def set_password(self, user_id, password):
+        """Change a password and revoke existing sessions"""
+        self._set_password(user_id, generate_password_hash(password, method=self.hash_method))
+        self.revoke_sessions(user_id)
+
+    def revoke_sessions(self, user_id):
+        """Log the user out everywhere"""
+        self._bump_version(user_id)
+        self.invalidate(user_id)
+
+
+class MemoryUserStore(UserStore):
+    """Backend keeping users in a dict, for development"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._users = {}
+        self._emails = {}
+
+    def _load(self, user_id):
+        row = self._users.get(user_id)
+        return User(user_id, row['email'], row['session_version']) if row else None
+
+    def _find(self, email):
+        user_id = self._emails.get(email)
+        return (user_id, self._users[user_id]['password_hash']) if user_id else None
+
+    def _create(self, email, password_hash):
+        user_id = len(self._users) + 1
+        self._users[user_id] = {'email': email, 'password_hash': password_hash, 'session_version': 1}
+        self._emails[email] = user_id
+        return user_id
+
+    def _set_password(self, user_id, password_hash):
+        self._users[user_id]['password_hash'] = password_hash
+
+    def _bump_version(self, user_id):
+        self._users[user_id]['session_version'] += 1
+
+
+class SQLAlchemyUserStore(UserStore):
+    """Backend keeping users in a database through Flask-SQLAlchemy"""
+
+    def _load(self, user_id):
+        row = db.session.execute(
+            db.select(UserRecord.email, UserRecord.session_version).where(UserRecord.id == user_id)
+        ).first()
+        return User(user_id, row.email, row.session_version) if row else None
+
+    def _find(self, email):
+        row = db.session.execute(
+            db.select(UserRecord.id, UserRecord.password_hash).where(UserRecord.email == email)
+        ).first()
+        return (row.id, row.password_hash) if row else None
+
+    def _create(self, email, password_hash):
+        record = UserRecord(email=email, password_hash=password_hash)
+        db.session.add(record)
+        db.session.commit()
+        return record.id
+
+    def _set_password(self, user_id, password_hash):
+        db.session.execute(
+            db.update(UserRecord).where(UserRecord.id == user_id).values(password_hash=password_hash)
+        )
+        db.session.commit()
+
+    def _bump_version(self, user_id):
+        db.session.execute(
+            db.update(UserRecord).where(UserRecord.id == user_id)
+            .values(session_version=UserRecord.session_version + 1)
+        )
+        db.session.commit()
+
+
+def benchmark_hashing(iteration_counts, rounds=5):
+    """Print the time of one password check for each PBKDF2 work factor"""
+    for iterations in iteration_counts:
+        password_hash = generate_password_hash('benchmark', method=f"pbkdf2:sha256:{iterations}")
+        started = time.perf_counter()
+        for _ in range(rounds):
+            check_password_hash(password_hash, 'benchmark')
+        elapsed = (time.perf_counter() - started) / rounds
+        print(f"pbkdf2:sha256:{iterations:<9} {elapsed * 1000:8.1f} ms per check  "
+              f"{1 / elapsed:6.1f} checks/s per core")
+
+
+if __name__ == '__main__':
+    benchmark_hashing([int(arg) for arg in sys.argv[1:]] or [200_000, 600_000, 1_000_000])